@@ -23,6 +23,7 @@ Summary
 ---------
 .. autosummary::
    build_table_from_fits_file
+   from_ascii_file
 
 Module API
 ----------
@@ -43,7 +44,6 @@ from builtins import (bytes, str, open, super, range,
 # Dependencies
 # eg numpy 
 # absolute import eg: import numpy as np
-from ..io.fits import read_data
 
 # Project
 # relative import eg: from .mod import f
@@ -72,9 +72,25 @@ def build_table_from_fits_file(input_file, black_listed_col_ids=None, black_list
     -------
 
     """
-    data,h = read_data(input_file,fits_ext=fits_ext)
-    return Table(data, black_listed_col_ids=black_listed_col_ids, black_listed_col_names=black_listed_col_names)
+    return Table.from_fits_file(input_file,
+                                black_listed_col_ids=black_listed_col_ids,
+                                black_listed_col_names=black_listed_col_names,
+                                fits_ext=fits_ext)
 
 
-def from_ascii_file():
-    pass
\ No newline at end of file
+def from_ascii_file(input_file, **kwargs):
+    """
+    Class factory using as input an ASCII (e.g. CSV) file
+
+    Parameters
+    ----------
+    input_file : string
+        input file path
+    kwargs :
+        the same kwargs of :meth:`.Table.from_ascii_file`
+
+    Returns
+    -------
+
+    """
+    return Table.from_ascii_file(input_file, **kwargs)
@@ -50,24 +50,32 @@ __author__ = "Andrea Tramacere"
 # Standard library
 # eg copy
 # absolute import rg:from copy import deepcopy
-from collections import Iterable
+from collections import OrderedDict
 
 # Dependencies
 # eg numpy 
 # absolute import eg: import numpy as np
 import numpy as np
-from numpy.lib import recfunctions
 
 # Project
 # relative import eg: from .mod import f
 from .tools import check_array_type,build_names_list
-from ..io.fits import   read_data
+from ..io.fits import   read_columns,read_columns_names,iter_columns_chunks,read_files_columns
+from ..io import ascii
+from ..io.memmap import read_memmap_dir,write_memmap_dir,source_schema,is_valid_memmap_dir
 
 
 
 
 
 
+def _as_column(values,copy=True):
+    if copy==True:
+        return np.array(values)
+    else:
+        return np.asarray(values)
+
+
 class Table(object):
 
 
@@ -77,6 +85,12 @@ class Table(object):
 
     for useful examples see the :ref:`table_user_guide` section
 
+    The table is stored column-wise, as a dictionary of contiguous 1dim (or ndim for vector columns)
+    arrays, so that adding or removing columns does not rewrite the other columns.
+    The structured array :attr:`data` is built only when it is requested, and the columns become views of it.
+    The column arrays can have spare rows, reserved by :meth:`add_rows`, that are not part of the table.
+    The original_entry_ID column is stored as an implicit range, until the rows are changed
+
 
 
     Parameters
@@ -92,6 +106,9 @@ class Table(object):
     store_entry_ID : bool
         bool value, if True, then a column named original_entry_ID is storing the ordinal ID
         of the input data
+    copy : bool
+        if False, the columns are views of `data` (e.g. a memory-mapped FITS table, see
+        :func:`PrimalCore.io.fits.read_data`), the table never changes them in place
 
     """
 
@@ -99,14 +116,19 @@ class Table(object):
                  black_listed_col_ids=None, \
                  black_listed_col_names=None, \
                  regex=True, \
-                 store_entry_ID=True):
+                 store_entry_ID=True,\
+                 copy=True):
 
         self._data_original_entry_ID_name='__original_entry_ID__'
+        self._columns=OrderedDict()
+        self._N_rows=None
+        self._data_cache=None
         self._set(data, \
                   black_listed_col_ids=black_listed_col_ids, \
                   black_listed_col_names=black_listed_col_names,\
                   store_entry_ID=store_entry_ID,\
-                  regex=regex)
+                  regex=regex,\
+                  copy=copy)
 
 
 
@@ -115,22 +137,22 @@ class Table(object):
         """
         Returns the np.dtype of `data`
         """
-        return  self._data.dtype
+        return  np.dtype([(name,)+self._column_dtype_shape(name) for name in self._columns])
 
     @property
     def column_names(self):
         """
         Returns the list of names of the fields of `data`
         """
-        return list(self.dtype.names)
+        return list(self._columns.keys())
 
     @property
     def N_rows(self):
         """
         Returns the number of rows in `data`
         """
-        if self._data is not None:
-            return  self._data.shape[0]
+        if len(self._columns)>0:
+            return  self._N_rows
         else:
             return None
 
@@ -139,8 +161,8 @@ class Table(object):
         """
         Returns the number of cols in `data`
         """
-        if self._data is not None:
-            return len(self._data.dtype.names)
+        if len(self._columns)>0:
+            return len(self._columns)
         else:
             return None
 
@@ -149,21 +171,82 @@ class Table(object):
         """
         Returns the original_entry_ID of the rows in the input table
         """
-        if self._data is not None:
-            return self._data[self._data_original_entry_ID_name]
+        if self._data_original_entry_ID_name in self._columns:
+            return self.get_column(self._data_original_entry_ID_name)
         else:
             return None
 
     @property
     def data(self):
         """
-        Returns the np.recarray storing the table data
+        Returns a numpy structured array with the table data. The array is built from the
+        columns when it is requested, and it is cached until the table is changed.
+        The columns are then stored as views of the structured array, so that, as for
+        a table stored as a structured array, writing to `data` changes the table.
+        When the table is changed the columns are copied back to contiguous arrays.
+        To read a single column use :meth:`get_column`, that does not build the structured array
         """
-        return self._data
+        if self._data_cache is None:
+            data=np.empty(self.N_rows,dtype=self.dtype)
+            for name in self._columns:
+                data[name]=self._column(name)
+            for name in self._columns:
+                self._columns[name]=data[name]
+            self._data_cache=data
+
+        return self._data_cache
+
+    def _invalidate_data_cache(self):
+        if self._data_cache is not None:
+            #the columns are views of the cached structured array, they are made contiguous
+            #so that they do not keep the whole array alive
+            for name,column in self._columns.items():
+                if isinstance(column,np.ndarray):
+                    self._columns[name]=np.ascontiguousarray(column)
+        self._data_cache=None
+
+    def get_column(self,name):
+        """
+        Returns the values of a column
+
+        Parameters
+        ----------
+        name : string
+            the name of the column
 
-    def _set(self,data,black_listed_col_ids=None,black_listed_col_names=None, regex=True,store_entry_ID=True):
+        Returns
+        -------
+        values : numpy array
+            read-only view of the contiguous column array
         """
-        Method to set the `_data` attribute
+        if name not in self._columns:
+            raise RuntimeError('column name %s not existing'%name)
+
+        values=self._column(name)
+        values.flags.writeable=False
+        return values
+
+    def _column(self,name):
+        """
+        Returns a view of the rows of the table in the array of the column `name`,
+        without the spare rows. Columns stored as an implicit range are built
+        """
+        column=self._columns[name]
+        if isinstance(column,slice):
+            return np.arange(column.start,column.stop)
+        else:
+            return column[:self._N_rows]
+
+    def _column_dtype_shape(self,name):
+        column=self._columns[name]
+        if isinstance(column,slice):
+            return np.arange(0).dtype,()
+        else:
+            return column.dtype,column.shape[1:]
+
+    def _set(self,data,black_listed_col_ids=None,black_listed_col_names=None, regex=True,store_entry_ID=True,copy=True):
+        """
+        Method to set the columns of the table
 
         Parameters
         ----------
@@ -178,6 +261,8 @@ class Table(object):
         store_entry_ID : bool
             bool value, if True, then a column named original_entry_ID is storing the ordinal ID
             of the input data
+        copy : bool
+            if False, the columns are views of `data`
 
 
 
@@ -194,53 +279,50 @@ class Table(object):
 
 
         if black_listed_col_ids is not None:
-            if type(black_listed_col_ids)==list:
+            if type(black_listed_col_ids)!=list:
                 black_listed_col_ids = list([black_listed_col_ids])
 
         if black_listed_col_names is not None:
-            if type(black_listed_col_names)==list:
+            if type(black_listed_col_names)!=list:
                 black_listed_col_names = list([black_listed_col_names])
 
+        self._columns=OrderedDict()
+        self._N_rows=data.shape[0]
         if is_2dimarray == True:
             if black_listed_col_ids is not None:
                 data = np.delete(data, black_listed_col_ids, 1)
             elif black_listed_col_names is not None:
                 raise RuntimeError("input data has no column names, please provide black_listed_col_ids ")
 
-            selected_cols = np.arange(data.shape[1])
-            _data_dtype = [('col_%d' % ID, data.dtype) for ID, foo in enumerate(selected_cols)]
-            self._data_names = list(self._data_dtype)
-            self._data_array = np.zeros(data.shape[0], dtype=_data_dtype)
-
-            for ID, col_name in enumerate(self._data_names):
-                self._data[col_name] = data[:, ID]
+            for ID in range(data.shape[1]):
+                self._columns['col_%d' % ID]=_as_column(data[:, ID],copy)
 
         else:
-
-
+            names_list=list(data.dtype.names)
             if black_listed_col_names is not None:
-                names_list = build_names_list(black_listed_col_names,list(data.dtype.names), regex=regex, skip=True)
-                self._data = recfunctions.drop_fields(data, names_list)
+                skip_names_list = build_names_list(black_listed_col_names,names_list, regex=regex, matching=True)
             elif black_listed_col_ids is not None:
-                self._data = recfunctions.drop_fields(data, [data.dtype.names[black_listed_col_ids]])
+                skip_names_list = [names_list[ID] for ID in black_listed_col_ids]
             else:
-                self._data = np.copy(data)
+                skip_names_list = []
 
+            skip_names_set=set(skip_names_list)
+            for name in names_list:
+                if name not in skip_names_set:
+                    self._columns[name]=_as_column(data[name],copy)
 
-        if store_entry_ID==True:
-            self._data = recfunctions.append_fields(self._data,  self._data_original_entry_ID_name,
-                                                      np.arange(self._data.size), usemask=False)
 
+        if store_entry_ID==True:
+            self._columns[self._data_original_entry_ID_name]=slice(0,data.shape[0])
 
-        #self._data_N_rows = self._data_array.size
-        #self._data_N_cols = len(self._data_names)
+        self._invalidate_data_cache()
 
         print("| input data built")
         print("| data Rows,Cols", self.N_rows, self.N_cols)
 
     def print_entry(self,ID):
         for name in self.column_names:
-            print (name,' =',self.data[ID][name])
+            print (name,' =',self._column(name)[ID])
 
     def add_columns(self, column_names, values_array, usemask=False, dtypes=None):
         """
@@ -257,6 +339,8 @@ class Table(object):
             of the new fields.
         values_array : array or sequence of arrays
             Array or sequence of arrays storing the fields to add to the base.
+        usemask : bool
+            masked columns are not supported, has to be False
         dtypes : sequence of datatypes
             Datatype or sequence of datatypes.
             If None, the datatypes are estimated from the `values_array`.
@@ -265,8 +349,38 @@ class Table(object):
         -------
 
         """
-        self._data =recfunctions.append_fields(self._data, column_names, values_array, usemask=usemask,
-                                          dtypes=dtypes)
+        if usemask is True:
+            raise RuntimeError('masked columns are not supported')
+
+        if type(column_names) not in (list,tuple):
+            column_names=[column_names]
+            values_array=[values_array]
+            if dtypes is not None:
+                dtypes=[dtypes]
+        else:
+            column_names=list(column_names)
+
+        if dtypes is None:
+            dtypes=[None]*len(column_names)
+        elif len(dtypes)==1 and len(column_names)>1:
+            dtypes=list(dtypes)*len(column_names)
+
+        if len(values_array)!=len(column_names) or len(dtypes)!=len(column_names):
+            raise RuntimeError('number of values arrays, or dtypes, not equal to the number of column names')
+
+        columns=[]
+        for name,values,dtype in zip(column_names,values_array,dtypes):
+            if name in self._columns:
+                raise RuntimeError('column name %s already existing'%name)
+            values=np.array(values,dtype=dtype)
+            if values.ndim==0 or values.shape[0]!=self.N_rows:
+                raise RuntimeError('number of rows in values of %s not equal to number of rows in data'%name)
+            columns.append((name,values))
+
+        for name,values in columns:
+            self._columns[name]=values
+
+        self._invalidate_data_cache()
 
     def drop_columns(self, drop_names_list,regex=True):
         """
@@ -286,7 +400,7 @@ class Table(object):
         """
         drop_names_list = build_names_list(drop_names_list, self.column_names, regex=regex, matching=True)
 
-        self._data= recfunctions.drop_fields(self._data, drop_names_list, usemask=False, asrecarray=False)
+        self._drop_columns(drop_names_list)
 
     def keep_columns(self, keep_names_list,regex=True):
         """
@@ -307,8 +421,73 @@ class Table(object):
         drop_names_list = build_names_list(keep_names_list, self.column_names, regex=regex, matching=False)
         if self._data_original_entry_ID_name in drop_names_list:
             drop_names_list.remove(self._data_original_entry_ID_name)
-        self._data= recfunctions.drop_fields(self._data, drop_names_list, usemask=False, asrecarray=False)
 
+        self._drop_columns(drop_names_list)
+
+    def _drop_columns(self,drop_names_list):
+        for name in drop_names_list:
+            self._columns.pop(name,None)
+
+        self._invalidate_data_cache()
+
+    def _apply_rows(self,rows):
+        """
+        Applies the rows selection `rows` to all the columns
+
+        Parameters
+        ----------
+        rows : boolean 1dim array, list, int 1dim np.array
+        """
+        N_rows=None
+        for name in self.column_names:
+            self._columns[name]=self._column(name)[rows]
+            N_rows=self._columns[name].shape[0]
+
+        if N_rows is not None:
+            self._N_rows=N_rows
+        self._invalidate_data_cache()
+
+    def _rows_to_keep_mask(self,rows):
+        """
+        Converts the rows to drop to a boolean mask of the rows to keep
+
+        Parameters
+        ----------
+        rows : boolean 1dim array, list, int 1dim np.array
+
+        Returns
+        -------
+        keep_mask : boolean 1dim array
+        """
+        rows=np.asarray(rows)
+        if rows.dtype==np.bool_:
+            if rows.size!=self.N_rows:
+                raise RuntimeError('boolean rows array size not equal to the number of rows in data')
+            return ~rows
+        else:
+            keep_mask=np.ones(self.N_rows,dtype=np.bool_)
+            keep_mask[rows.astype(np.intp)]=False
+            return keep_mask
+
+    def _reserve_rows(self,extra_rows):
+        """
+        Ensures that each column array has room for `extra_rows` rows. If a column array is
+        reallocated, its capacity is at least doubled, so that repeated appends have an amortized
+        linear cost
+
+        Parameters
+        ----------
+        extra_rows : int
+        """
+        N_rows=self.N_rows
+        for name in self.column_names:
+            column=self._columns[name]
+            if isinstance(column,slice):
+                column=self._column(name)
+            if column.shape[0]<N_rows+extra_rows:
+                buffer=np.empty((max(N_rows+extra_rows,2*N_rows),)+column.shape[1:],dtype=column.dtype)
+                buffer[:N_rows]=column[:N_rows]
+                self._columns[name]=buffer
 
     def add_rows(self,values_array):
         """
@@ -320,7 +499,9 @@ class Table(object):
         Parameters
         ----------
         values_array : 2-dim  numpy ndarrary, numpy struct array, numpy record array
-            the ndarray array storing the data to add to the table
+            the ndarray array storing the data to add to the table, the columns are
+            matched by position. The rows are copied column-wise, in blocks, and the columns capacity
+            grows by doubling, so that repeated appends have an amortized linear cost
 
         Returns
         -------
@@ -328,18 +509,25 @@ class Table(object):
         """
         is_2dimarray, is_struct_array, is_record_array = check_array_type(values_array)
         if is_2dimarray==True:
-            extra_rows=values_array.shape[0]
-        elif is_struct_array == True:
-            extra_rows=values_array.size
-        elif is_record_array==True:
-            extra_rows = values_array.size
+            values_list=[values_array[:,ID] for ID in range(values_array.shape[1])]
+        elif is_struct_array == True or is_record_array==True:
+            values_list=[values_array[name] for name in values_array.dtype.names]
         else:
             raise RuntimeError(
                 "values_array has to be a 2dim numpy array, or a numpy record array, or a numpy structured array")
 
-        self._data.resize(self.N_rows+extra_rows)
-        for ID,d in enumerate(values_array):
-            self._data[self.N_rows-extra_rows+ID]=tuple(d)
+        if len(values_list)!=self.N_cols:
+            raise RuntimeError('number of columns in values_array not equal to number of columns in data')
+
+        extra_rows=values_list[0].shape[0]
+        self._reserve_rows(extra_rows)
+
+        N_rows=self.N_rows
+        for name,values in zip(self.column_names,values_list):
+            self._columns[name][N_rows:N_rows+extra_rows]=values
+
+        self._N_rows=N_rows+extra_rows
+        self._invalidate_data_cache()
 
 
 
@@ -357,7 +545,8 @@ class Table(object):
     def drop_rows(self, rows):
         """
         This method allows to drop rows passing a boolean 1d-array, a list, or an int 1dim np.array
-        The entries with rows==True, or corresponding to the indices in rows, will be dropped
+        The entries with rows==True, or corresponding to the indices in rows, will be dropped.
+        The rows are removed with a single gather for each column
 
         Parameters
         ----------
@@ -367,8 +556,7 @@ class Table(object):
         """
         print("| filtering data rows")
         print("| data initial Rows =", self.N_rows)
-        not_rows = [i for i in range(self.N_rows) if i not in rows]
-        self._data = self._data[not_rows]
+        self._apply_rows(self._rows_to_keep_mask(rows))
         print("| data filtered initial Rows =", self.N_rows)
         print("")
 
@@ -384,36 +572,467 @@ class Table(object):
 
         """
         print("| filtering data rows")
-        print("| data initial Rows,Cols=", self._data.shape)
-        self._data = self._data[rows]
-        print("| data filtered Rows,Cols=", self._data.shape)
+        print("| data initial Rows,Cols=", self.N_rows, self.N_cols)
+        self._apply_rows(rows)
+        print("| data filtered Rows,Cols=", self.N_rows, self.N_cols)
         print("")
 
     # Constructors
     @classmethod
-    def from_fits_file(cls, input_file, black_listed_col_ids=None, black_listed_col_names=None, fits_ext=0):
+    def from_columns(cls, columns, store_entry_ID=True, copy=True):
         """
-        This function provides a method to read a data table from a FITS file, and reaturns a :class:`.Table` object
+        This function provides a method to build a :class:`.Table` object from a dictionary of columns,
+        without building a structured array
+
+        Parameters
+        ----------
+        cls
+        columns : dictionary, or list of (name, array) tuples
+            name->1dim (or ndim for vector columns) array, all with the same number of rows.
+            Use an :class:`collections.OrderedDict`, or a list, to set the columns order.
+            A `slice` value is stored as the implicit range of int values `slice.start,...,slice.stop-1`
+        store_entry_ID : bool
+            bool value, if True, then a column named original_entry_ID is storing the ordinal ID
+            of the input data, if a column with this name is provided, it is overwritten
+        copy : bool
+            if False, the columns arrays are not copied
+
+        Returns
+        -------
+        table : :class:`.Table` object
+        """
+        table=cls.__new__(cls)
+        table._data_original_entry_ID_name='__original_entry_ID__'
+        table._columns=OrderedDict()
+        table._N_rows=None
+        table._data_cache=None
+
+        N_rows=None
+        for name,values in OrderedDict(columns).items():
+            if isinstance(values,slice):
+                values_N_rows=values.stop-values.start
+            else:
+                values=_as_column(values,copy)
+                values_N_rows=values.shape[0]
+            if N_rows is None:
+                N_rows=values_N_rows
+            elif values_N_rows!=N_rows:
+                raise RuntimeError('column %s has a number of rows different from the other columns'%name)
+            table._columns[name]=values
+
+        table._N_rows=N_rows
+        if store_entry_ID==True:
+            table._columns[table._data_original_entry_ID_name]=slice(0,N_rows)
+
+        return table
+
+    @classmethod
+    def from_fits_file(cls,
+                       input_file,
+                       black_listed_col_ids=None,
+                       black_listed_col_names=None,
+                       fits_ext=0,
+                       use_col_names=None,
+                       regex=True,
+                       rows_range=None,
+                       row_filter=None,
+                       memmap=False,
+                       cache_directory=None):
+        """
+        This function provides a method to read a data table from a FITS file, and reaturns a :class:`.Table` object.
+        Only the selected columns and rows are read from the file (see :func:`PrimalCore.io.fits.read_columns`),
+        and the original_entry_ID stores the IDs of the rows in the FITS table
 
         Parameters
         ----------
         cls
         input_file : file path
             the input fits file
-        id_column_name :
-        id_column_num
-        fits_ext
+        black_listed_col_ids: list of int
+            the list of columns to skip
+        black_listed_col_names: list of strings
+            the list of column names to skip
+        fits_ext : int
+            the extension of the fits file storing the table data
+        use_col_names : list of strings, optional
+            the list of column names to read, if None all the columns are read
+        regex : bool
+            if True, regex is applied to use_col_names and black_listed_col_names
+        rows_range : tuple of int, optional
+            (start, stop) of the rows to read
+        row_filter : callable, optional
+            a function taking the table rows (a :class:`astropy.io.fits.FITS_rec`,
+            whose columns are read only if accessed) and returning a boolean array
+            of the rows to keep
+        memmap : bool
+            if True, the columns are zero-copy views of the memory-mapped file, when possible,
+            they are copied only when the table rows are changed
+        cache_directory : string, optional
+            if provided, the table is reloaded, memory mapped, from the cache written by :meth:`save_memmap`
+            in this directory, if the cache was built from the current content of `input_file`,
+            with the same arguments. Otherwise the table is read and the cache is written
+
+        Returns
+        -------
+        table : :class:`.Table` object
+        """
+        if cache_directory is not None:
+            if row_filter is not None:
+                raise RuntimeError('row_filter can not be used with cache_directory')
+            options={'reader':'fits',
+                     'black_listed_col_ids':black_listed_col_ids,
+                     'black_listed_col_names':black_listed_col_names,
+                     'fits_ext':fits_ext,
+                     'use_col_names':use_col_names,
+                     'regex':regex,
+                     'rows_range':rows_range}
+            return cls._from_cache(cache_directory,
+                                   input_file,
+                                   options,
+                                   lambda : cls.from_fits_file(input_file,
+                                                               black_listed_col_ids=black_listed_col_ids,
+                                                               black_listed_col_names=black_listed_col_names,
+                                                               fits_ext=fits_ext,
+                                                               use_col_names=use_col_names,
+                                                               regex=regex,
+                                                               rows_range=rows_range,
+                                                               memmap=memmap))
+
+        skip_col_names=None
+        if black_listed_col_names is not None:
+            if type(black_listed_col_names)!=list:
+                black_listed_col_names = list([black_listed_col_names])
+            skip_col_names=black_listed_col_names
+
+        if black_listed_col_ids is not None:
+            if type(black_listed_col_ids)!=list:
+                black_listed_col_ids = list([black_listed_col_ids])
+            names_list=read_columns_names(input_file,fits_ext=fits_ext)
+            skip_col_names=(skip_col_names or [])+[names_list[ID] for ID in black_listed_col_ids]
+
+        columns,rows_IDs=read_columns(input_file,
+                                      fits_ext=fits_ext,
+                                      use_col_names=use_col_names,
+                                      skip_col_names=skip_col_names,
+                                      regex=regex,
+                                      rows_range=rows_range,
+                                      row_filter=row_filter,
+                                      header=False,
+                                      copy=not memmap)
+
+        columns['__original_entry_ID__']=rows_IDs
+        table=cls.from_columns(columns,store_entry_ID=False,copy=False)
+
+        print("| input data built")
+        print("| data Rows,Cols", table.N_rows, table.N_cols)
+
+        return table
+
+    @classmethod
+    def from_fits_files(cls,
+                        input_files,
+                        fits_ext=0,
+                        use_col_names=None,
+                        black_listed_col_names=None,
+                        regex=True,
+                        row_filter=None,
+                        n_threads=None,
+                        source_file_ID_col_name='__source_file_ID__'):
+        """
+        This function provides a method to read the same table from many FITS files (e.g. one for each tile),
+        concurrently, into a single :class:`.Table` object, without merging the tables of each file
+        (see :func:`PrimalCore.io.fits.read_files_columns`).
+
+        The original_entry_ID is unique across the files: the rows of each file are offset by the
+        total number of rows of the previous files, and the `source_file_ID_col_name` column
+        stores, for each row, the index of its file in `input_files`
+
+        Parameters
+        ----------
+        cls
+        input_files : list of file paths, or string
+            the input fits files, or a glob pattern, the files matching a pattern are sorted
+        fits_ext : int
+            the extension of the fits files storing the table data
+        use_col_names : list of strings, optional
+            the list of column names to read, if None all the columns are read
+        black_listed_col_names: list of strings
+            the list of column names to skip
+        regex : bool
+            if True, regex is applied to use_col_names and black_listed_col_names
+        row_filter : callable, optional
+            a function taking the rows of a file (a :class:`astropy.io.fits.FITS_rec`)
+            and returning a boolean array of the rows to keep
+        n_threads : int, optional
+            the number of threads reading the files, if None the number of cpus is used
+        source_file_ID_col_name : string
+            the name of the column storing the index of the source file
 
         Returns
         -------
+        table : :class:`.Table` object
+        """
+        if black_listed_col_names is not None:
+            if type(black_listed_col_names)!=list:
+                black_listed_col_names = list([black_listed_col_names])
+
+        columns,rows_IDs,files_IDs,input_files=read_files_columns(input_files,
+                                                                  fits_ext=fits_ext,
+                                                                  use_col_names=use_col_names,
+                                                                  skip_col_names=black_listed_col_names,
+                                                                  regex=regex,
+                                                                  row_filter=row_filter,
+                                                                  n_threads=n_threads)
+
+        columns[source_file_ID_col_name]=files_IDs
+        columns['__original_entry_ID__']=rows_IDs
+        table=cls.from_columns(columns,store_entry_ID=False,copy=False)
+
+        print("| input data built from %d files"%len(input_files))
+        print("| data Rows,Cols", table.N_rows, table.N_cols)
+
+        return table
 
+    @classmethod
+    def _from_cache(cls,cache_directory,input_file,options,build):
+        """
+        Reloads a table from a valid cache, or builds it with `build` and writes the cache
         """
-        data, h = read_data(input_file, fits_ext=fits_ext)
-        return cls(data, black_listed_col_ids=black_listed_col_ids, black_listed_col_names=black_listed_col_names)
+        if is_valid_memmap_dir(cache_directory,input_file,options):
+            print("| reading cache", cache_directory)
+            return cls.from_memmap(cache_directory)
+
+        table=build()
+        table.save_memmap(cache_directory,source_file=input_file,source_options=options)
+        return cls.from_memmap(cache_directory)
 
     @classmethod
-    def from_ascii_file(cls):
-        pass
+    def from_memmap(cls,directory,mmap_mode='r'):
+        """
+        This function provides a method to build a :class:`.Table` object from a directory written by :meth:`save_memmap`.
+        The columns are backed by :class:`numpy.memmap` files, and they are not loaded in memory
+
+        Parameters
+        ----------
+        cls
+        directory : string
+            the directory storing the table
+        mmap_mode : {'r', 'r+', 'c'} (default='r')
+            the memory-mapping mode of :func:`numpy.load`
+
+        Returns
+        -------
+        table : :class:`.Table` object
+        """
+        arrays_dict,schema=read_memmap_dir(directory,mmap_mode=mmap_mode)
+
+        columns=[]
+        for ID,name in enumerate(schema['column_names']):
+            if 'col_%d'%ID in arrays_dict:
+                columns.append((name,arrays_dict['col_%d'%ID]))
+            else:
+                start,stop=schema['range_columns'][name]
+                columns.append((name,slice(start,stop)))
+
+        return cls.from_columns(columns,store_entry_ID=False,copy=False)
+
+    def save_memmap(self,directory,source_file=None,source_options=None):
+        """
+        Saves the table to a directory, with one `.npy` file for each column, and a JSON schema.
+        The table can be reloaded, memory mapped, with :meth:`Table.from_memmap`
+
+        Parameters
+        ----------
+        directory : string
+            the output directory
+        source_file : string, optional
+            the file the table was read from, a checksum of the file is stored in the schema,
+            to check the validity of the cache (see :func:`PrimalCore.io.memmap.is_valid_memmap_dir`)
+        source_options : dictionary, optional
+            the options used to read `source_file`
+
+        Returns
+        -------
+
+        """
+        arrays_dict={}
+        range_columns={}
+        for ID,name in enumerate(self.column_names):
+            column=self._columns[name]
+            if isinstance(column,slice):
+                range_columns[name]=[int(column.start),int(column.stop)]
+            else:
+                arrays_dict['col_%d'%ID]=self._column(name)
+
+        schema={'column_names':self.column_names,
+                'range_columns':range_columns}
+        if source_file is not None:
+            schema.update(source_schema(source_file,source_options))
+
+        write_memmap_dir(directory,arrays_dict,schema=schema)
+
+    @classmethod
+    def iter_fits_chunks(cls,
+                         input_file,
+                         chunk_rows=100000,
+                         fits_ext=0,
+                         use_col_names=None,
+                         black_listed_col_names=None,
+                         regex=True,
+                         row_filter=None):
+        """
+        Generator streaming a table of a FITS file in blocks of rows, each returned as a :class:`.Table` object.
+        The original_entry_ID of each block stores the IDs of the rows in the FITS table, so that the
+        blocks can be processed independently (see :func:`PrimalCore.io.fits.iter_columns_chunks`)
+
+        Parameters
+        ----------
+        cls
+        input_file : file path
+            the input fits file
+        chunk_rows : int
+            the number of rows of each block
+        fits_ext : int
+            the extension of the fits file storing the table data
+        use_col_names : list of strings, optional
+            the list of column names to read, if None all the columns are read
+        black_listed_col_names: list of strings
+            the list of column names to skip
+        regex : bool
+            if True, regex is applied to use_col_names and black_listed_col_names
+        row_filter : callable, optional
+            a function taking the rows of a block (a :class:`astropy.io.fits.FITS_rec`)
+            and returning a boolean array of the rows to keep
+
+        Yields
+        -------
+        table : :class:`.Table` object
+        """
+        for columns,rows_IDs in iter_columns_chunks(input_file,
+                                                    chunk_rows=chunk_rows,
+                                                    fits_ext=fits_ext,
+                                                    use_col_names=use_col_names,
+                                                    skip_col_names=black_listed_col_names,
+                                                    regex=regex,
+                                                    row_filter=row_filter):
+
+            columns['__original_entry_ID__']=rows_IDs
+            yield cls.from_columns(columns,store_entry_ID=False,copy=False)
+
+    @classmethod
+    def from_ascii_file(cls,
+                        input_file,
+                        delimiter=None,
+                        comments='#',
+                        names=None,
+                        dtypes=None,
+                        use_col_names=None,
+                        black_listed_col_names=None,
+                        regex=True,
+                        rows_range=None):
+        """
+        This function provides a method to read a data table from an ASCII (e.g. CSV) file, and returns a :class:`.Table` object.
+        The rows are parsed directly to typed columns, reading only the selected columns
+        (see :func:`PrimalCore.io.ascii.read_columns`)
+
+        Parameters
+        ----------
+        cls
+        input_file : file path
+            the input ASCII file
+        delimiter : str, optional
+            the columns delimiter, if None any whitespace
+        comments : str
+            the comment character
+        names : list of strings, optional
+            the columns names, if None they are read from the first line
+        dtypes : dictionary, optional
+            name->dtype, if not provided the dtypes are inferred from the first rows
+        use_col_names : list of strings, optional
+            the list of column names to read, if None all the columns are read
+        black_listed_col_names: list of strings
+            the list of column names to skip
+        regex : bool
+            if True, regex is applied to use_col_names and black_listed_col_names
+        rows_range : tuple of int, optional
+            (start, stop) of the data rows to read, comment and blank lines are not counted
+
+        Returns
+        -------
+        table : :class:`.Table` object
+        """
+        columns,rows_IDs=ascii.read_columns(input_file,
+                                            delimiter=delimiter,
+                                            comments=comments,
+                                            names=names,
+                                            dtypes=dtypes,
+                                            use_col_names=use_col_names,
+                                            skip_col_names=black_listed_col_names,
+                                            regex=regex,
+                                            rows_range=rows_range)
+
+        columns['__original_entry_ID__']=rows_IDs
+        table=cls.from_columns(columns,store_entry_ID=False,copy=False)
+
+        print("| input data built")
+        print("| data Rows,Cols", table.N_rows, table.N_cols)
+
+        return table
+
+    @classmethod
+    def iter_ascii_chunks(cls,
+                          input_file,
+                          chunk_rows=100000,
+                          delimiter=None,
+                          comments='#',
+                          names=None,
+                          dtypes=None,
+                          use_col_names=None,
+                          black_listed_col_names=None,
+                          regex=True):
+        """
+        Generator streaming an ASCII table in blocks of rows, each returned as a :class:`.Table` object.
+        The original_entry_ID of each block stores the IDs of the rows in the ASCII table
+        (see :func:`PrimalCore.io.ascii.iter_columns_chunks`)
+
+        Parameters
+        ----------
+        cls
+        input_file : file path
+            the input ASCII file
+        chunk_rows : int
+            the number of rows of each block
+        delimiter : str, optional
+            the columns delimiter, if None any whitespace
+        comments : str
+            the comment character
+        names : list of strings, optional
+            the columns names, if None they are read from the first line
+        dtypes : dictionary, optional
+            name->dtype, if not provided the dtypes are inferred from the first rows
+        use_col_names : list of strings, optional
+            the list of column names to read, if None all the columns are read
+        black_listed_col_names: list of strings
+            the list of column names to skip
+        regex : bool
+            if True, regex is applied to use_col_names and black_listed_col_names
+
+        Yields
+        -------
+        table : :class:`.Table` object
+        """
+        for columns,rows_IDs in ascii.iter_columns_chunks(input_file,
+                                                          chunk_rows=chunk_rows,
+                                                          delimiter=delimiter,
+                                                          comments=comments,
+                                                          names=names,
+                                                          dtypes=dtypes,
+                                                          use_col_names=use_col_names,
+                                                          skip_col_names=black_listed_col_names,
+                                                          regex=regex):
+
+            columns['__original_entry_ID__']=rows_IDs
+            yield cls.from_columns(columns,store_entry_ID=False,copy=False)
 
     @staticmethod
     def _check_is_Table(test):
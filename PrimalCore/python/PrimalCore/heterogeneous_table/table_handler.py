@@ -39,7 +39,6 @@ __author__ = "Andrea Tramacere"
 # Dependencies
 # eg numpy 
 # absolute import eg: import numpy as np
-from numpy.lib import recfunctions
 import  numpy as np
 
 # Project
@@ -66,17 +65,22 @@ def tables_merge_rows(tab1,tab2,update_original_entry_ID=False):
     -------
     table :class:`Table` object
     """
-    for tab in [tab1,tab1]:
+    for tab in [tab1,tab2]:
         if Table._check_is_Table(tab):
             pass
         else:
-            raise RuntimeError('tab1 or tab2 are not both DataSetBase objects')
-    return Table(data=np.concatenate((tab1.data,tab2.data)),store_entry_ID=update_original_entry_ID)
+            raise RuntimeError('tab1 or tab2 are not both Table objects')
+
+    if tab1.column_names!=tab2.column_names:
+        raise RuntimeError('tab1 and tab2 have different columns')
+
+    columns=[(name,np.concatenate((tab1.get_column(name),tab2.get_column(name)))) for name in tab1.column_names]
+    return Table.from_columns(columns,store_entry_ID=update_original_entry_ID)
 
 
 def tables_merge_columns(tab1,tab2):
     """
-    merges to Tables, columns wise
+    merges to Tables, columns wise. The original_entry_ID of `tab1` is kept
 
     Parameters
     ----------
@@ -87,12 +91,22 @@ def tables_merge_columns(tab1,tab2):
     -------
     table :class:`Table` object
     """
-    for tab in [tab1,tab1]:
+    for tab in [tab1,tab2]:
         if Table._check_is_Table(tab):
             pass
         else:
-            raise RuntimeError('tab1 or tab2 are not both DataSetBase objects')
+            raise RuntimeError('tab1 or tab2 are not both Table objects')
 
-    return Table(data=recfunctions.merge_arrays((tab1.data,tab2.data),usemask=False))
+    if tab1.N_rows!=tab2.N_rows:
+        raise RuntimeError('tab1 and tab2 have different number of rows')
 
+    columns=[(name,tab1.get_column(name)) for name in tab1.column_names]
+    names_set=set(tab1.column_names)
+    for name in tab2.column_names:
+        if name==tab2._data_original_entry_ID_name:
+            continue
+        if name in names_set:
+            raise RuntimeError('column name %s present in both tab1 and tab2'%name)
+        columns.append((name,tab2.get_column(name)))
 
+    return Table.from_columns(columns,store_entry_ID=False)
@@ -56,10 +56,48 @@ import  numpy as np
 # relative import eg: from .mod import f
 from ..heterogeneous_table.tools import build_names_list
 from ..heterogeneous_table.table import Table
+from ..io.memmap import read_memmap_dir,write_memmap_dir,source_schema,is_valid_memmap_dir
 from .tools import  *
 __author__ = "Andrea Tramacere"
 
 
+def _is_not_empty(IDs):
+    return IDs is not None and len(IDs)>0
+
+
+def _to_IDs_array(IDs):
+    """
+    Converts a list of int, a 1dim int array, or a 1dim bool array, to a 1dim int array
+    """
+    IDs=np.asarray(IDs)
+    if np.issubdtype(IDs.dtype,np.bool_):
+        return np.flatnonzero(IDs)
+    else:
+        return IDs.astype(np.intp)
+
+
+def _fits_use_col_names(argw):
+    """
+    Returns the names of the columns to read from a FITS file, to build a dataset with the
+    :meth:`MLDataSet.new_from_table` arguments `argw`, or None if all the columns have to be read
+    """
+    use_col_names=None
+    if _is_not_empty(argw.get('use_col_names_list')) \
+            and not _is_not_empty(argw.get('use_col_num_list')) \
+            and not _is_not_empty(argw.get('skip_col_num_list')) \
+            and argw.get('target_col_num') is None:
+        use_col_names=argw['use_col_names_list']
+        if type(use_col_names)!=list:
+            use_col_names=list([use_col_names])
+        use_col_names=list(use_col_names)
+        if argw.get('target_col_name') is not None:
+            use_col_names.append(argw['target_col_name'])
+        if argw.get('original_entry_ID_col_name') not in (None,'__original_entry_ID__'):
+            use_col_names.append(argw['original_entry_ID_col_name'])
+
+    return use_col_names
+
+
 class MLDataSet(object):
     """
     This class contains the features 2-dim array together with
@@ -78,13 +116,14 @@ class MLDataSet(object):
     target_array : 1dim array, optional
         the target used for training/classification, size= number of rows in features
 
-    target_bins : int, optional
+    target_bins : int, or 1dim array, optional
         if the target is not a label, or it is a continuous variable, the stratified sampling
         might fail. Setting target_bins, a binning is performed with bins equal to target_bins.
-        Each entry will have label given by the bin ID
+        Each entry will have label given by the bin ID. If target_bins is an array, it is used
+        as the precomputed bins edges
 
     target_binning : str, optional, default='linear'
-        The binning strategy: 'linear' or 'log'
+        The binning strategy: 'linear', 'log', or 'quantile'
 
     weight_array : 1dim array, optional
         the weight array, used for the training,  size= number of rows in features
@@ -92,6 +131,15 @@ class MLDataSet(object):
     features_original_entry_ID  : 1dim array of int, optional
         the original entry ID of the entries
 
+    order : str, optional, default='C'
+        the memory layout of the features storage: 'C' (row-major) or 'F' (column-major).
+        The column-major layout makes column-wise operations faster
+
+    dtype : numpy dtype, optional
+        the dtype of the features storage, e.g. `np.float32` to halve the memory footprint.
+        If None, the dtype of `features` is used. When set, features added to the dataset
+        are cast to this dtype
+
 
 
     """
@@ -104,17 +152,33 @@ class MLDataSet(object):
                  columns_mask=None,
                  rows_mask=None,
                  features_original_entry_ID=None,
-                 catalog_file=None):
+                 catalog_file=None,
+                 order='C',
+                 dtype=None):
         """
 
 
         """
+        if order not in ['C','F']:
+            raise RuntimeError('order possible choices C or F, found %s' % order)
+        self._order=order
+
+        if dtype is not None:
+            dtype=np.dtype(dtype)
+        self._dtype=dtype
+
+        self._features_cache=None
+        self._features_buffer=None
+        self._buffer_rows=None
+        self._buffer_N_cols=None
+        self._buffer_cols=None
+        self._features_shared=False
         self._features=features
 
         if features_names is not None:
-            self._features_names=features_names
+            self._set_features_names(features_names)
         else:
-            self._features_names=['F_%d'%ID for ID in range(features.shape[1])]
+            self._set_features_names(['F_%d'%ID for ID in range(features.shape[1])])
 
 
         if target_array is not None:
@@ -125,8 +189,8 @@ class MLDataSet(object):
         self.target_bins=target_bins
 
         if target_binning is not None:
-            if target_binning not in ['linear','log']:
-                raise RuntimeError('target_binning possible choices linear or log, found' % target_binning)
+            if target_binning not in ['linear','log','quantile']:
+                raise RuntimeError('target_binning possible choices linear, log, or quantile, found %s' % target_binning)
 
         self.target_binning=target_binning
 
@@ -136,10 +200,11 @@ class MLDataSet(object):
             self._weight_array=None
 
         self._features_original_entry_ID=features_original_entry_ID
-        self._stratifying_array=None
+        self._stratifying_cache={}
 
         self.catalog_file=catalog_file
 
+        self._selection_index=None
         self.columns_mask=columns_mask
         self.rows_mask=rows_mask
         self.selection_mask = None
@@ -155,16 +220,432 @@ class MLDataSet(object):
         """
         getter
 
+        The masked features are materialized only once, and cached until
+        the masks, the selection mask, or `_features` are changed.
+        If the masks select contiguous rows and columns, a view of `_features`
+        is returned, and no copy is performed.
+
         Returns
         -------
         `_features`: list
             the features `numpy.darray`, read-only.
 
         """
-        if self.selection_mask is None:
-            return self._features[self.rows_mask][:,self.columns_mask]
+        if self._features_cache is None:
+            self._features_cache=self._build_features()
+        return self._features_cache
+
+    def _build_features(self):
+        """
+        Applies the rows, columns, and selection masks to `_features`, with a single gather
+
+        Returns
+        -------
+        features : `numpy.ndarray`
+            read-only masked features
+        """
+        return self._gather_features(self._buffer_rows_index(self._rows_index))
+
+    def _buffer_rows_index(self,rows):
+        """
+        Composes a rows index of the dataset with the rows of the shared buffer, if any
+
+        Parameters
+        ----------
+        rows : slice or 1dim int array
+
+        Returns
+        -------
+        rows : slice or 1dim int array
+            the rows index relative to `_features_buffer`
+        """
+        if self._buffer_rows is not None:
+            rows = compose_index(self._buffer_rows, rows)
+        return rows
+
+    def _buffer_columns_index(self,cols):
+        """
+        Composes a columns index of the dataset with the live columns of the buffer, if
+        some columns have been lazily dropped
+
+        Parameters
+        ----------
+        cols : slice or 1dim int array, or int
+
+        Returns
+        -------
+        cols : slice or 1dim int array, or int
+            the columns index relative to `_features_buffer`
+        """
+        if self._buffer_cols is not None:
+            if isinstance(cols,(slice,np.ndarray)):
+                cols = compose_index(self._buffer_cols, cols)
+            else:
+                cols = self._buffer_cols[cols]
+        return cols
+
+    def _gather_features(self,rows,cols=None):
+        """
+        Gathers the masked columns of the `_features_buffer` rows, with a single gather
+
+        Parameters
+        ----------
+        rows : slice or 1dim int array
+            the rows index relative to `_features_buffer`
+        cols : slice or 1dim int array, optional
+            the columns index relative to `_features`, if None the masked columns are gathered
+
+        Returns
+        -------
+        features : `numpy.ndarray`
+            read-only masked features
+        """
+        if cols is None:
+            cols = self._features_columns_index
+        cols = self._buffer_columns_index(cols)
+
+        if isinstance(rows, slice) or isinstance(cols, slice):
+            features = self._features_buffer[rows, cols]
         else:
-            return self._features[self.rows_mask][:, self.columns_mask][:,self.selection_mask]
+            features = self._features_buffer[np.ix_(rows, cols)]
+
+        features.flags.writeable = False
+        return features
+
+    def _invalidate_features_cache(self):
+        self._features_cache=None
+
+    @property
+    def _features(self):
+        """
+        getter/setter
+
+        If the dataset shares the buffer of a parent dataset
+        (see :func:`~PrimalCore.homogeneous_table.dataset_handler.new_from_rows`),
+        the rows of the dataset are gathered from the shared buffer.
+        The buffer can have spare columns, reserved by
+        :func:`~PrimalCore.homogeneous_table.dataset_handler.add_features`, and columns
+        lazily dropped by :func:`~PrimalCore.homogeneous_table.dataset_handler.drop_features`,
+        that are not returned.
+
+        Returns
+        -------
+        `_features_buffer` : 2dim array
+            the un-masked features array
+
+        setter
+
+        Parameters
+        ----------
+        features :  2dim array
+            sets the un-masked features array, owned by the dataset, and invalidates the features cache.
+            The array is converted to the :attr:`order` memory layout, and to the dataset dtype, if needed
+        """
+        features=self._features_buffer
+        if self._buffer_N_cols<features.shape[1]:
+            features=features[:,:self._buffer_N_cols]
+
+        if self._buffer_cols is not None:
+            if self._buffer_rows is None:
+                return features[:,self._buffer_cols]
+            elif isinstance(self._buffer_rows,slice):
+                return features[self._buffer_rows,self._buffer_cols]
+            else:
+                return features[np.ix_(self._buffer_rows,self._buffer_cols)]
+
+        if self._buffer_rows is None:
+            return features
+        else:
+            return features[self._buffer_rows]
+
+    @_features.setter
+    def _features(self, features):
+        if features is self._features_buffer and self._buffer_rows is None:
+            self._invalidate_features_cache()
+            return
+
+        self._features_buffer=np.asarray(features,dtype=self._dtype,order=self._order)
+        self._buffer_N_cols=self._features_buffer.shape[1]
+        self._buffer_cols=None
+        self._buffer_rows=None
+        self._features_shared=False
+        self._invalidate_features_cache()
+
+    def _drop_buffer_columns(self,remove_ID_list):
+        """
+        Lazily drops columns of `_features`, updating only the index of the live columns
+        of the buffer. The buffer is compacted by :meth:`_compact_features`, or when it is
+        copied or reallocated
+
+        Parameters
+        ----------
+        remove_ID_list : list of int
+            the columns IDs, relative to `_features`, to drop
+        """
+        if self._buffer_cols is None:
+            live_cols=np.arange(self._buffer_N_cols)
+        else:
+            live_cols=self._buffer_cols
+        self._buffer_cols=np.delete(live_cols,remove_ID_list)
+        self._invalidate_features_cache()
+
+    def _compact_features(self):
+        """
+        Copies the live columns of `_features` to a new buffer, releasing the columns
+        lazily dropped, and the spare columns reserved by :meth:`_reserve_features_columns`
+        """
+        if self._buffer_cols is not None or self._features_buffer.shape[1]>self._buffer_N_cols:
+            self._features=np.array(self._features,order=self._order)
+
+    @property
+    def order(self):
+        """
+        getter/setter
+
+        Returns
+        -------
+        `_order` : str
+            the memory layout of the features storage, 'C' (row-major) or 'F' (column-major)
+
+
+        setter
+
+        Parameters
+        ----------
+        order : str
+            'C' or 'F', the features storage is converted to the new layout
+        """
+        return self._order
+
+    @order.setter
+    def order(self, order):
+        if order not in ['C','F']:
+            raise RuntimeError('order possible choices C or F, found %s' % order)
+        if order != self._order:
+            self._order=order
+            self._features=np.asarray(self._features,order=order)
+
+    @property
+    def dtype(self):
+        """
+        getter/setter
+
+        Returns
+        -------
+        dtype : numpy dtype
+            the dtype of the features storage
+
+
+        setter
+
+        Parameters
+        ----------
+        dtype : numpy dtype
+            the features storage is cast to the new dtype, that is kept
+            when features are added to the dataset
+        """
+        return self._features_buffer.dtype
+
+    @dtype.setter
+    def dtype(self, dtype):
+        dtype=np.dtype(dtype)
+        self._dtype=dtype
+        if dtype != self._features_buffer.dtype:
+            self._features=np.asarray(self._features,dtype=dtype)
+
+    def _result_dtype(self,*arrays):
+        """
+        Returns the dtype of the features storage after adding `arrays`: the dataset dtype,
+        if set, otherwise the dtype promoted from the storage and the arrays dtypes
+
+        Parameters
+        ----------
+        arrays : `numpy.ndarray`
+
+        Returns
+        -------
+        dtype : numpy dtype
+        """
+        if self._dtype is not None:
+            return self._dtype
+        else:
+            return np.result_type(self._features_buffer,*arrays)
+
+    def _own_features(self):
+        """
+        Copy on write: if the `_features` buffer is shared with other datasets,
+        the dataset rows are copied to a buffer owned by the dataset.
+        Has to be called before any in-place change of `_features`
+        """
+        if self._buffer_rows is not None:
+            features=self._features
+            if isinstance(self._buffer_rows,slice):
+                features=np.copy(features)
+            self._features=features
+        elif self._features_shared is True:
+            self._features=np.copy(self._features)
+
+    def _reserve_features_columns(self,extra_N_cols,dtype=None,amortized=True):
+        """
+        Ensures that the `_features` buffer, owned by the dataset, has room for `extra_N_cols`
+        columns. If the buffer has to be reallocated and `amortized` is True, the capacity
+        grows by a factor 1.5, so that adding features one by one has an amortized linear cost.
+        With the 'C' order the spare columns are allocated in every row, so the growth factor
+        is kept small, and the spare columns are released by :meth:`_compact_features`
+
+        Parameters
+        ----------
+        extra_N_cols : int
+            the number of columns to add
+        dtype : numpy dtype, optional
+            the dtype of the buffer, if None the current dtype is used
+        amortized : bool
+            if True, the capacity grows at least by a factor 1.5 when reallocating
+        """
+        if dtype is None:
+            dtype=self._features_buffer.dtype
+
+        if self._buffer_rows is None and self._features_shared is False \
+                and self._features_buffer.shape[1]>=self._buffer_N_cols+extra_N_cols \
+                and self._features_buffer.dtype==dtype:
+            return
+
+        # the live columns are compacted in the new buffer
+        N_cols=self.features_N_cols
+        capacity=N_cols+extra_N_cols
+        if amortized is True:
+            capacity=max(capacity,(3*N_cols)//2)
+
+        buffer=np.empty((self.features_N_rows,capacity),dtype=dtype,order=self._order)
+        buffer[:,:N_cols]=self._features
+        self._features_buffer=buffer
+        self._buffer_N_cols=N_cols
+        self._buffer_cols=None
+        self._buffer_rows=None
+        self._features_shared=False
+        self._invalidate_features_cache()
+
+    def _append_features_columns(self,features_list,amortized=True):
+        """
+        Appends columns to the `_features` buffer, writing them in the reserved spare
+        columns, without copying the existing features, if the capacity is enough
+
+        Parameters
+        ----------
+        features_list : list of 2dim arrays
+            each array has a number of rows equal to :attr:`features_N_rows`
+        amortized : bool
+            if True, the capacity grows at least by a factor 1.5 when reallocating
+        """
+        extra_N_cols=sum([features.shape[1] for features in features_list])
+        self._reserve_features_columns(extra_N_cols,dtype=self._result_dtype(*features_list),amortized=amortized)
+
+        start_ID=self._buffer_N_cols
+        ID=start_ID
+        for features in features_list:
+            self._features_buffer[:,ID:ID+features.shape[1]]=features
+            ID+=features.shape[1]
+
+        self._buffer_N_cols=ID
+        if self._buffer_cols is not None:
+            self._buffer_cols=np.append(self._buffer_cols,np.arange(start_ID,ID))
+        self._invalidate_features_cache()
+
+    def _share_features(self):
+        """
+        Returns a shallow copy of the dataset, sharing the `_features` buffer.
+        The buffer is copied on write, by any of the datasets sharing it
+
+        Returns
+        -------
+        new : :class:`MLDataSet`
+        """
+        new=copy.copy(self)
+        new._features_names=list(self._features_names)
+        new._features_names_index=dict(self._features_names_index)
+        new._stratifying_cache=dict(self._stratifying_cache)
+        new._features_cache=None
+        self._features_shared=True
+        new._features_shared=True
+        return new
+
+    def _take_buffer_rows(self,selected):
+        """
+        Restricts the rows of the dataset to `selected`, without copying the shared buffer
+
+        Parameters
+        ----------
+        selected : 1dim bool array,or list, or 1dim int array
+        """
+        rows=selection_to_index(selected,self.features_N_rows)
+        if self._buffer_rows is not None:
+            rows=compose_index(self._buffer_rows,rows)
+        self._buffer_rows=rows
+        self._invalidate_features_cache()
+
+    @property
+    def selection_mask(self):
+        """
+        getter/setter
+
+        Returns
+        -------
+        selection mask : 1dim bool array, or None
+            the selection mask, applied to the masked columns
+
+
+        setter
+
+        Parameters
+        ----------
+        mask :  1dim bool array, 1dim int array, or None
+            sets the selection mask
+        """
+        if self._selection_index is None:
+            return None
+        return index_to_mask(self._selection_index,index_size(self._columns_index))
+
+    @selection_mask.setter
+    def selection_mask(self, mask):
+        if mask is not None:
+            self._selection_index=mask_to_index(mask,index_size(self._columns_index))
+        else:
+            self._selection_index=None
+        self._update_features_columns_index()
+
+    def _update_features_columns_index(self):
+        """
+        Precomputes the composition of the columns index and of the selection index
+        """
+        if self._selection_index is None:
+            self._features_columns_index=self._columns_index
+        else:
+            self._features_columns_index=compose_index(self._columns_index,self._selection_index)
+        self._invalidate_features_cache()
+
+    @property
+    def rows_index(self):
+        """
+        getter
+
+        Returns
+        -------
+        `_rows_index` : slice or sorted 1dim int array
+            the compact representation of :attr:`rows_mask`
+        """
+        return self._rows_index
+
+    @property
+    def columns_index(self):
+        """
+        getter
+
+        Returns
+        -------
+        `_features_columns_index` : slice or sorted 1dim int array
+            the compact representation of the composition of :attr:`columns_mask` and :attr:`selection_mask`
+        """
+        return self._features_columns_index
 
     @property
     def columns_mask(self):
@@ -173,27 +654,26 @@ class MLDataSet(object):
 
         Returns
         -------
-        `_columns_mask` : 1dim bool array
-            the column mask
+        columns mask : 1dim bool array
+            the column mask, built from :attr:`columns_index`
 
 
         setter
 
         Parameters
         ----------
-        mask :  1dim bool array
+        mask :  1dim bool array, or 1dim int array
             sets the column mask
         """
-        return self._columns_mask
+        return index_to_mask(self._columns_index,self.features_N_cols)
 
     @columns_mask.setter
     def columns_mask(self, mask):
         if mask is not None:
             check_array_is_1dim(mask)
             check_same_size(mask,self.features_N_cols)
-        else:
-            mask = np.ones(self.features_N_cols,dtype=np.bool)
-        self._columns_mask=mask
+        self._columns_index=mask_to_index(mask,self.features_N_cols)
+        self._update_features_columns_index()
 
 
     @property
@@ -203,27 +683,26 @@ class MLDataSet(object):
 
         Returns
         -------
-        `_rows_mask` : 1dim bool array
-            the rows mask
+        rows mask : 1dim bool array
+            the rows mask, built from :attr:`rows_index`
 
 
         setter
 
         Parameters
         ----------
-        mask :  1dim bool array
+        mask :  1dim bool array, or 1dim int array
             sets the row mask
         """
-        return self._rows_mask
+        return index_to_mask(self._rows_index,self.features_N_rows)
 
     @rows_mask.setter
     def rows_mask(self, mask):
         if  mask is not None:
             check_array_is_1dim(mask)
             check_same_size(mask, self.features_N_rows)
-        else:
-            mask=np.ones(self.features_N_rows,dtype=np.bool)
-        self._rows_mask= mask
+        self._rows_index=mask_to_index(mask,self.features_N_rows)
+        self._invalidate_features_cache()
 
 
     @property
@@ -243,23 +722,79 @@ class MLDataSet(object):
         names : list
             sets the  features names list
         """
-        if np.issubdtype(self.columns_mask.dtype,np.bool):
-            ids=np.where(self.columns_mask==True)[0]
+        ids=self._features_columns_index
+        if isinstance(ids,slice):
+            return self._features_names[ids]
         else:
-            ids=self.columns_mask
-        _l=[self._features_names[i] for i in ids]
-        if self.selection_mask is not None:
-            if np.issubdtype(self.selection_mask.dtype, np.bool):
-                ids = np.where(self.selection_mask == True)[0]
-            _l =[_l[i] for i in ids]
-
-        return _l
+            return [self._features_names[i] for i in ids]
 
 
     @features_names.setter
     def features_names(self,names):
         check_same_size(len(names),self.features_N_cols)
-        self._features_names=names
+        self._set_features_names(names)
+
+    def _set_features_names(self,names):
+        """
+        Sets the un-masked features names list, and rebuilds the name->column index
+        dictionary. If a name is duplicated, the index of the first column is stored
+
+        Parameters
+        ----------
+        names : list
+        """
+        self._features_names=list(names)
+        self._features_names_index={}
+        for ID,name in enumerate(self._features_names):
+            self._features_names_index.setdefault(name,ID)
+
+    def _append_features_names(self,names):
+        """
+        Appends names to the un-masked features names list, updating incrementally
+        the name->column index dictionary
+
+        Parameters
+        ----------
+        names : list
+        """
+        N_cols=len(self._features_names)
+        self._features_names.extend(names)
+        for ID,name in enumerate(names):
+            self._features_names_index.setdefault(name,N_cols+ID)
+
+    def _get_feature_column_ID(self,feature_name):
+        """
+        Returns the column ID in `_features` of an un-masked feature
+
+        Parameters
+        ----------
+        feature_name : string
+
+        Returns
+        -------
+        ID : int
+        """
+        try:
+            return self._features_names_index[feature_name]
+        except KeyError:
+            raise RuntimeError('feature name  %s not existing'%feature_name)
+
+    def _get_masked_feature_column_ID(self,feature_name):
+        """
+        Returns the column ID in `_features` of a feature selected by the columns and selection masks
+
+        Parameters
+        ----------
+        feature_name : string
+
+        Returns
+        -------
+        ID : int
+        """
+        ID=self._get_feature_column_ID(feature_name)
+        if index_contains(self._features_columns_index,ID) is False:
+            raise RuntimeError('feature name  %s not existing'%feature_name)
+        return ID
 
 
 
@@ -282,13 +817,14 @@ class MLDataSet(object):
            the new target array
 
         """
-        return self._target_array[self.rows_mask]
+        return self._target_array[self._rows_index]
 
     @target_array.setter
     def target_array(self,array):
         check_array_is_1dim(array)
         check_same_size(array.size,self.features_N_rows)
         self._target_array=np.copy(array)
+        self._stratifying_cache={}
 
 
 
@@ -297,49 +833,109 @@ class MLDataSet(object):
         """
         getter
 
+        The binned target is cached for each (target_bins, target_binning) pair, the cache
+        is invalidated when the target changes, and it is carried over by rows selection
+
         Returns
         -------
          _stratifying_array : `numpy.ndarray`
              the stratifying array, obtained by binning the target_array
         """
         if self.target_bins is None:
-            return self.target_array[self.rows_mask]
+            return self.target_array
 
-        if self._stratifying_array is not None:
-            return self._stratifying_array[self.rows_mask]
-        else:
+        key=self._stratifying_key()
+        if key not in self._stratifying_cache:
             self._update_stratifying_array(binning=self.target_binning)
-            return self._stratifying_array[self.rows_mask]
+        return self._stratifying_cache[key][self._rows_index]
 
-    def _update_stratifying_array(self,binning=None):
+    def _stratifying_key(self,binning=None):
         """
-        Updates the value of :member:`PrimalCore.homogeneous_table.dataset._stratifying_array`
+        Returns the key of the stratifying array cache, i.e. the tuple (target_bins, target_binning)
 
         Parameters
         ----------
-        binning
+        binning : str, optional
+            if None, :attr:`target_binning` is used
 
         Returns
         -------
+        key : tuple
+        """
+        if binning is None:
+            binning=self.target_binning
+
+        bins=self.target_bins
+        if np.ndim(bins)>0:
+            bins=tuple(np.asarray(bins).tolist())
+
+        return bins,binning
+
+    def target_bins_edges(self,binning=None):
+        """
+        Returns the edges used to bin the target array
 
+        Parameters
+        ----------
+        binning : str, optional
+            'linear', 'log', or 'quantile'. If None, :attr:`target_binning` is used
+
+        Returns
+        -------
+        bins : 1dim array
+            the bins edges, that can be passed as `target_bins` to other datasets
+            (e.g. to share quantile bins among subsets)
         """
         if binning is None:
             binning=self.target_binning
 
+        if np.ndim(self.target_bins)>0:
+            return np.asarray(self.target_bins)
+
+        if binning == 'linear':
+            x1 = self._target_array.min()
+            x2 = self._target_array.max()
+            bins = np.linspace(x1, x2, self.target_bins)
+        elif binning == 'log':
+            x1 = np.log10(self._target_array.min())
+            x2 = np.log10(self._target_array.max())
+            bins = np.logspace(x1, x2, self.target_bins)
+        elif binning == 'quantile':
+            # interior quantiles only, to get target_bins equally populated bins
+            bins = np.quantile(self._target_array, np.linspace(0, 1, self.target_bins+1)[1:-1])
+        else:
+            raise RuntimeError('target_binning possible choices linear, log, or quantile, found %s' % binning)
+
+        return bins
+
+    def _update_stratifying_array(self,binning=None):
+        """
+        Updates the cached stratifying array for the current target_bins, and `binning`
+
+        Parameters
+        ----------
+        binning
+
+        Returns
+        -------
+
+        """
         if self.target_bins is None:
-            self._stratifying_array= self._target_array
+            return
 
-        else:
-            if binning == 'linear':
-                x1 = self._target_array.min()
-                x2 = self._target_array.max()
-                bins = np.linspace(x1, x2, self.target_bins)
-            elif binning == 'log':
-                x1 = np.log10(self._target_array.min())
-                x2 = np.log10(self._target_array.max())
-                bins = np.logspace(x1, x2, self.target_bins)
+        self._stratifying_cache[self._stratifying_key(binning)]=np.digitize(self._target_array,
+                                                                            self.target_bins_edges(binning),
+                                                                            right=True)
 
-            self._stratifying_array= np.digitize(self._target_array, bins, right=True)
+    def _take_stratifying_cache(self,selected):
+        """
+        Carries over the stratifying array cache to a rows selection
+
+        Parameters
+        ----------
+        selected : 1dim bool array,or list, or 1dim int array
+        """
+        self._stratifying_cache=dict((key,array[selected]) for key,array in self._stratifying_cache.items())
 
 
     @property
@@ -360,7 +956,7 @@ class MLDataSet(object):
         array : `numpy.ndarray`
             the weight array
         """
-        return self._weight_array[self.rows_mask]
+        return self._weight_array[self._rows_index]
 
     @weight_array.setter
     def weight_array(self,array):
@@ -389,7 +985,7 @@ class MLDataSet(object):
         array : `numpy.ndarray`
             the original entry ID
         """
-        return self._features_original_entry_ID[self.rows_mask]
+        return self._features_original_entry_ID[self._rows_index]
 
     @features_original_entry_ID.setter
     def features_original_entry_ID(self,array):
@@ -408,7 +1004,10 @@ class MLDataSet(object):
         ._features.shape[0]: int
             the number or rows of `_features`
         """
-        return  self._features.shape[0]
+        if self._buffer_rows is None:
+            return  self._features_buffer.shape[0]
+        else:
+            return index_size(self._buffer_rows)
 
 
     @property
@@ -421,7 +1020,10 @@ class MLDataSet(object):
         ._features.shape[1]: int
             the number or columns of `_features`
         """
-        return  self._features.shape[1]
+        if self._buffer_cols is None:
+            return  self._buffer_N_cols
+        else:
+            return self._buffer_cols.size
 
     def set_feature(self,feature_name,values):
         """
@@ -435,13 +1037,12 @@ class MLDataSet(object):
         """
         check_array_is_1dim(values)
         check_same_size(values.size, self.features_N_rows)
-        if feature_name not in self._features_names:
-            raise RuntimeError('feature name  %s not existing',feature_name)
+        ID=self._get_feature_column_ID(feature_name)
 
-        for ID,name in enumerate(self._features_names):
-                if name==feature_name:
-                    self._features[:,ID]=values
+        self._own_features()
+        self._features_buffer[:,self._buffer_columns_index(ID)]=values
 
+        self._invalidate_features_cache()
 
     def rename_feature(self,old_name,new_name):
         """
@@ -453,10 +1054,10 @@ class MLDataSet(object):
 
         new_name : string
         """
-        if old_name not in self.features_names:
-            raise  RuntimeError('name %s not present in _features_names')
-        else:
-            self._features_names=[new_name if x==old_name else x for x in self._features_names]
+        ID=self._get_masked_feature_column_ID(old_name)
+        self._features_names[ID]=new_name
+        del self._features_names_index[old_name]
+        self._features_names_index.setdefault(new_name,ID)
     #------------------------------------
     # factories
     #------------------------------------
@@ -464,6 +1065,8 @@ class MLDataSet(object):
     def new_from_fits_file(cls,
                            file,
                            fits_ext=0,
+                           memmap=False,
+                           cache_directory=None,
                            **argw):
         """
         Class method to build a MLDataSet from a fitsfile object
@@ -476,15 +1079,86 @@ class MLDataSet(object):
         fits_ext : int (default=0)
             the fits extension corresponding to the table
 
+        memmap : bool (default=False)
+            if True, the table columns are memory mapped, and only the features array is allocated
+
+        cache_directory : basestring, optional
+            if provided, the dataset is reloaded, memory mapped, from the cache written by :meth:`MLDataSet.save_memmap`
+            in this directory, if the cache was built from the current content of `file`, with the same
+            arguments. Otherwise the dataset is built and the cache is written
+
         argw :
-            the same argw in :func:`~MLDataSet.new_from_table`
+            the same argw in :func:`~MLDataSet.new_from_table`. If `use_col_names_list` is provided,
+            and columns are not selected by number, only the used columns are read from the file
 
         Returns
         -------
 
         """
-        table=Table.from_fits_file(file,fits_ext=fits_ext)
-        return MLDataSet.new_from_table(table,**argw)
+        if cache_directory is not None:
+            options=dict(argw)
+            options['fits_ext']=fits_ext
+            if is_valid_memmap_dir(cache_directory,file,options):
+                print("| reading cache", cache_directory)
+                return cls.new_from_memmap(cache_directory)
+
+        table=Table.from_fits_file(file,
+                                   fits_ext=fits_ext,
+                                   use_col_names=_fits_use_col_names(argw),
+                                   regex=argw.get('regex',True),
+                                   memmap=memmap)
+        dataset=cls.new_from_table(table,**argw)
+
+        if cache_directory is not None:
+            dataset.save_memmap(cache_directory,source_file=file,source_options=options)
+            dataset=cls.new_from_memmap(cache_directory)
+
+        return dataset
+
+    @classmethod
+    def new_from_memmap(cls,directory,mmap_mode='r'):
+        """
+        Class method to build a MLDataSet from a directory written by :meth:`MLDataSet.save_memmap`.
+        The features, target, weight and original entry ID arrays are backed by :class:`numpy.memmap`
+        files, so that several processes can share the same dataset without loading it.
+        With `mmap_mode='r'` the features are copied on write, e.g. by :meth:`MLDataSet.set_feature`
+
+        Parameters
+        ----------
+        directory : basestring
+            the directory storing the dataset
+
+        mmap_mode : {'r', 'r+', 'c'} (default='r')
+            the memory-mapping mode of :func:`numpy.load`
+
+        Returns
+        -------
+        dataset : :class:`MLDataSet`
+        """
+        arrays_dict,schema=read_memmap_dir(directory,mmap_mode=mmap_mode)
+
+        target_bins=schema['target_bins']
+        if isinstance(target_bins,list):
+            target_bins=np.array(target_bins)
+
+        dataset=cls(arrays_dict['features'],
+                    features_names=schema['features_names'],
+                    target_bins=target_bins,
+                    target_binning=schema['target_binning'],
+                    columns_mask=arrays_dict.get('columns_mask'),
+                    rows_mask=arrays_dict.get('rows_mask'),
+                    features_original_entry_ID=arrays_dict.get('original_entry_ID'),
+                    catalog_file=schema['catalog_file'],
+                    order=schema['order'],
+                    dtype=schema.get('dtype'))
+
+        dataset._target_array=arrays_dict.get('target')
+        dataset._weight_array=arrays_dict.get('weight')
+        dataset.selection_mask=arrays_dict.get('selection_mask')
+        if mmap_mode=='r':
+            dataset._features_shared=True
+
+        return dataset
 
     @classmethod
     def new_from_table(cls,table,\
@@ -502,7 +1176,9 @@ class MLDataSet(object):
                        regex=True,\
                        rows_IDs_use_list=[],\
                        rows_IDs_skip_list=[],
-                       catalog_file=None):
+                       catalog_file=None,
+                       order='C',
+                       dtype=None):
 
         """
         Class method to build a MLDataSet from :class:`PrimalCore.heterogeneous_table.table.Table` object
@@ -517,13 +1193,14 @@ class MLDataSet(object):
         weight_array : 1dim array, optional
             the weight array, used for the training,  size= number of rows in features
 
-        target_bins : int, optional
+        target_bins : int, or 1dim array, optional
             if the target is not a label, or it is a contineous variable, the stratified sampling m
             might fail. Setting target_bins, a binning is performed with bins equal to target_bins.
-            Each entry will have label given by the bin ID
+            Each entry will have label given by the bin ID. If target_bins is an array, it is used
+            as the precomputed bins edges
 
         target_binning : str, optional, default='linear'
-            The binning strategy: 'linear' or 'log'
+            The binning strategy: 'linear', 'log', or 'quantile'
 
         target_col_num : int, optional
             the ID of the column in the Table, tu be used as target
@@ -539,99 +1216,107 @@ class MLDataSet(object):
             the list fo column names to discard. If regex==True, all the columns names matching any
             of the regular expression will be discarded
 
-        use_col_num_list : list of int
+        use_col_num_list : list of int, 1dim array of int, or 1dim bool array
          the list on columns IDs to use
 
-        skip_col_num_list : list of int
+        skip_col_num_list : list of int, 1dim array of int, or 1dim bool array
          the list on columns IDs to discard
 
         regex : boolean, default=True
             if True, regular expression are used for `use_col_names_list` and `skip_col_names_list`
 
-        rows_IDs_use_list : list of int, or 1dim array of int
+        rows_IDs_use_list : list of int, 1dim array of int, or 1dim bool array
             the rows IDs to use
 
-        rows_IDs_skip_list  : list of int, or 1dim array of int
+        rows_IDs_skip_list  : list of int, 1dim array of int, or 1dim bool array
             the rows IDs to discard
 
 
         catalog_file : string
 
+        order : str, optional, default='C'
+            the memory layout of the features storage: 'C' (row-major) or 'F' (column-major)
+
+        dtype : numpy dtype, optional
+            the dtype of the features storage, e.g. `np.float32`. The features are cast while
+            they are filled, without building an intermediate array with the promoted dtype
+
         Returns
         -------
 
         """
 
         print("| building features")
-        cols_ID_use_list=range(table.N_cols)
-        names_list=table.column_names
-
-        if target_col_num is not None:
-            cols_ID_use_list.remove(target_col_num)
-
-        if target_col_name is not None:
-            names_list.remove(target_col_name)
+        column_names=table.column_names
 
         #column filtering
-        if skip_col_num_list!=[] and skip_col_num_list is not None:
-            cols_ID_use_list=[ID for ID in range(table.N_cols) if ID not in skip_col_num_list]
-            names_list=names_list[cols_ID_use_list]
-
-        if use_col_num_list!=[] and use_col_num_list is not None:
-            cols_ID_use_list=use_col_num_list
-            names_list=names_list[cols_ID_use_list]
+        if _is_not_empty(use_col_num_list):
+            cols_ID_use_list=_to_IDs_array(use_col_num_list)
+        else:
+            cols_ID_use_list=np.arange(table.N_cols)
 
+        if _is_not_empty(skip_col_num_list):
+            cols_ID_use_list=cols_ID_use_list[~np.isin(cols_ID_use_list,_to_IDs_array(skip_col_num_list))]
 
+        if target_col_num is not None:
+            if use_col_num_list is not None and target_col_num in _to_IDs_array(use_col_num_list):
+                raise RuntimeError("features  can not be used as target")
+            cols_ID_use_list=cols_ID_use_list[cols_ID_use_list!=target_col_num]
 
+        names_list=[column_names[ID] for ID in cols_ID_use_list]
 
-        if use_col_names_list!=[] and use_col_names_list is not None:
-            names_list=build_names_list(use_col_names_list,names_list,regex=regex,matching=True)
+        if target_col_name is not None:
+            names_list=[name for name in names_list if name!=target_col_name]
 
-        skip_col_names_list.append(original_entry_ID_col_name)
-        if skip_col_names_list!=[] and skip_col_names_list is not None:
-            names_list=build_names_list(skip_col_names_list,names_list,regex=regex,matching=False)
-
-        features_names=names_list
-        features=np.vstack([table.data[item] for item in names_list]).T
-        features_original_entry_ID=table.data[original_entry_ID_col_name]
+        if _is_not_empty(use_col_names_list):
+            names_list=build_names_list(list(use_col_names_list),names_list,regex=regex,matching=True)
 
+        if _is_not_empty(skip_col_names_list):
+            skip_col_names_list=list(skip_col_names_list)+[original_entry_ID_col_name]
+        else:
+            skip_col_names_list=[original_entry_ID_col_name]
+        names_list=build_names_list(skip_col_names_list,names_list,regex=regex,matching=False)
+
+        #row filtering, applied in the same gather used to fill the features
+        rows_IDs=None
+        if _is_not_empty(rows_IDs_use_list):
+            rows_IDs=_to_IDs_array(rows_IDs_use_list)
+
+        if _is_not_empty(rows_IDs_skip_list):
+            use_rows=np.ones(table.N_rows,dtype=np.bool_)
+            use_rows[_to_IDs_array(rows_IDs_skip_list)]=False
+            if rows_IDs is None:
+                rows_IDs=np.flatnonzero(use_rows)
+            else:
+                rows_IDs=rows_IDs[use_rows[rows_IDs]]
 
+        if rows_IDs is None:
+            rows=slice(0,table.N_rows)
+        else:
+            rows=selection_to_index(rows_IDs,table.N_rows)
 
+        features_names=names_list
+        if dtype is None:
+            features_dtype=np.result_type(*[table.get_column(item).dtype for item in names_list])
+        else:
+            features_dtype=dtype
+        features=np.empty((index_size(rows),len(names_list)),
+                          dtype=features_dtype,
+                          order=order)
+        for ID,item in enumerate(names_list):
+            features[:,ID]=table.get_column(item)[rows]
+        features_original_entry_ID=table.get_column(original_entry_ID_col_name)[rows]
 
         if target_col_name is not None:
-            if target_col_name in features_names:
-                raise RuntimeError("features  can not be used as target")
-            else:
-                target_array=table.data[target_col_name]
+            target_array=table.get_column(target_col_name)
 
         if target_col_num is not None:
-            if target_col_num in cols_ID_use_list:
-                raise RuntimeError("features  can not be used as target")
-            else:
-                target_array=table.data[:,target_col_num]
-
-
-        #row filtering
-        if rows_IDs_use_list!=[] and    rows_IDs_use_list!=None:
-            features=features[rows_IDs_use_list]
-            features_original_entry_ID=features_original_entry_ID[rows_IDs_use_list]
-            if target_array is not None:
-                target_array=target_array[rows_IDs_use_list]
-            if weight_array is not None:
-                weight_array=weight_array[rows_IDs_use_list]
-
-        if rows_IDs_skip_list!=[] and    rows_IDs_skip_list!=None:
-            use_list=[ID for ID in range(table.N_rows) if ID not in rows_IDs_skip_list]
-            features=features[use_list]
-            features_original_entry_ID=features_original_entry_ID[use_list]
-            if target_array is not None:
-                target_array=target_array[use_list]
-            if weight_array is not None:
-                weight_array=weight_array[use_list]
-
-
-
+            target_array=table.get_column(column_names[target_col_num])
 
+        if target_array is not None:
+            target_array=target_array[rows]
+        if weight_array is not None:
+            weight_array=weight_array[rows]
 
         return MLDataSet(features,\
                          features_names=features_names, \
@@ -640,7 +1325,9 @@ class MLDataSet(object):
                          target_array=target_array,\
                          weight_array=weight_array,\
                          features_original_entry_ID=features_original_entry_ID,
-                         catalog_file=catalog_file)
+                         catalog_file=catalog_file,
+                         order=order,
+                         dtype=dtype)
 
 
 
@@ -665,13 +1352,149 @@ class MLDataSet(object):
         features values : `numpy.ndarray` 1dim
             the feature values
         """
-        if feature_name not in self.features_names:
-            raise RuntimeError('feature name  %s not existing',feature_name)
-        for ID,name in enumerate(self.features_names):
-                if name==feature_name:
-                    return self.features[:,ID]
+        col_ID=self._get_masked_feature_column_ID(feature_name)
+        rows=self._buffer_rows_index(self._rows_index)
+
+        values=self._features_buffer[rows,self._buffer_columns_index(col_ID)]
+        if isinstance(rows,slice):
+            values.flags.writeable = False
+        return values
+
+
+
+    def iter_chunks(self,chunk_size=100000):
+        """
+        Iterates over the masked dataset in blocks of rows, without materializing
+        :attr:`features`. The features blocks are views of `_features`, when the rows
+        and columns masks are contiguous
+
+        Parameters
+        ----------
+        chunk_size : int (default=100000)
+            the number of rows in each block
+
+        Returns
+        -------
+        generator of tuples (features, target, weight, original_entry_ID) :
+            the blocks of :attr:`features`, :attr:`target_array`, :attr:`weight_array`
+            and :attr:`features_original_entry_ID`, None if the array is not set
+        """
+        N_rows=index_size(self._rows_index)
+        for start in range(0,N_rows,chunk_size):
+            rows=compose_index(self._rows_index,slice(start,min(start+chunk_size,N_rows)))
+
+            features=self._gather_features(self._buffer_rows_index(rows))
+            target=None
+            weight=None
+            original_entry_ID=None
+            if self._target_array is not None:
+                target=self._target_array[rows]
+            if self._weight_array is not None:
+                weight=self._weight_array[rows]
+            if self._features_original_entry_ID is not None:
+                original_entry_ID=self._features_original_entry_ID[rows]
+
+            yield features,target,weight,original_entry_ID
+
+    def _iter_features_blocks(self,chunk_size=100000):
+        """
+        Iterates over the un-masked `_features` in blocks of rows, without materializing them
+
+        Parameters
+        ----------
+        chunk_size : int (default=100000)
+            the number of rows in each block
+
+        Returns
+        -------
+        generator of read-only 2dim arrays
+        """
+        if self._buffer_rows is None:
+            N_rows=self._features_buffer.shape[0]
+        else:
+            N_rows=index_size(self._buffer_rows)
+        for start in range(0,N_rows,chunk_size):
+            rows=self._buffer_rows_index(slice(start,min(start+chunk_size,N_rows)))
+            yield self._gather_features(rows,cols=self._features_live_columns())
 
+    def _features_live_columns(self):
+        """
+        Returns the index of all the columns of `_features`, relative to the dataset columns
+        """
+        if self._buffer_cols is None:
+            return slice(0,self._buffer_N_cols)
+        else:
+            return slice(0,self._buffer_cols.size)
 
+    def _transform_features(self,transform,chunk_size=100000):
+        """
+        Applies `transform` in place to the un-masked `_features`, in blocks of rows,
+        so that only one transformed block is allocated at a time. The buffer is
+        copied first if it is shared with other datasets (see :meth:`_own_features`)
+
+        Parameters
+        ----------
+        transform : callable
+            a function taking a 2dim block of rows, and returning the transformed block, with the same shape
+        chunk_size : int (default=100000)
+            the number of rows in each block
+        """
+        self._own_features()
+        if self._dtype is None and not np.issubdtype(self._features_buffer.dtype,np.floating):
+            self._features=self._features.astype(np.float64)
+
+        cols=self._buffer_columns_index(self._features_live_columns())
+
+        N_rows=self._features_buffer.shape[0]
+        for start in range(0,N_rows,chunk_size):
+            rows=slice(start,min(start+chunk_size,N_rows))
+            self._features_buffer[rows,cols]=transform(self._features_buffer[rows,cols])
+
+        self._invalidate_features_cache()
+
+    #------------------------------------
+    # I/O
+    #------------------------------------
+    def save_memmap(self,directory,source_file=None,source_options=None):
+        """
+        Saves the dataset to a directory, with one `.npy` file for each of the  features,
+        target, weight, original entry ID and masks arrays, and a JSON schema.
+        The dataset can be reloaded, memory-mapped, with :meth:`MLDataSet.new_from_memmap`
+
+        Parameters
+        ----------
+        directory : basestring
+            the output directory
+
+        source_file : basestring, optional
+            the file the dataset was built from, a checksum of the file is stored in the schema,
+            to check the validity of the cache (see :func:`PrimalCore.io.memmap.is_valid_memmap_dir`)
+
+        source_options : dictionary, optional
+            the options used to build the dataset from `source_file`
+
+        Returns
+        -------
+
+        """
+        arrays_dict={'features':self._features,
+                     'target':self._target_array,
+                     'weight':self._weight_array,
+                     'original_entry_ID':self._features_original_entry_ID,
+                     'rows_mask':self.rows_mask,
+                     'columns_mask':self.columns_mask,
+                     'selection_mask':self.selection_mask}
+
+        schema={'features_names':self._features_names,
+                'target_bins':np.asarray(self.target_bins).tolist() if self.target_bins is not None else None,
+                'target_binning':self.target_binning,
+                'catalog_file':self.catalog_file,
+                'order':self.order,
+                'dtype':None if self._dtype is None else self._dtype.str}
+        if source_file is not None:
+            schema.update(source_schema(source_file,source_options))
+
+        write_memmap_dir(directory,arrays_dict,schema=schema)
 
     #------------------------------------
     # checkers
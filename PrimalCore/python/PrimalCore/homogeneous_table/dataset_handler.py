@@ -40,13 +40,16 @@ from builtins import (bytes, str, open, super, range,
 # absolute import eg: import numpy as np
 import numpy as np
 from scipy._lib import decorator
-import copy
+import os
+import shutil
 
 # Project
 # relative import eg: from .mod import f
-from .dataset import MLDataSet
+from .dataset import MLDataSet,_fits_use_col_names,_is_not_empty
+from ..heterogeneous_table.table import Table
 from .tools import *
 from ..heterogeneous_table.tools import build_names_list
+from ..io.memmap import open_memmap_array
 
 try:
     basestring
@@ -98,21 +101,100 @@ def check_names_list_decorate(func,dataset,names,*args, **kwargs):
 @check_dataset_decorate
 def new_from_rows(dataset, selected):
     """
-    Creates a new :class:`MLDataSet` from an existing one, by row selection
+    Creates a new :class:`MLDataSet` from an existing one, by row selection.
+    The new dataset shares the `_features` buffer of `dataset`, and stores only the
+    index of the selected rows. The buffer is copied on write, when either dataset changes
+    its features
 
     Parameters
     ----------
-    selected
+    dataset : instance of :class:`.dataset.MLDataSet`
+    selected : 1d boolean array,or list, or 1d int array
 
     Returns
     -------
-
+    new : instance of :class:`.dataset.MLDataSet`
     """
-    new = copy.deepcopy(dataset)
+    new = dataset._share_features()
     keep_rows(new, selected)
     return new
 
 
+def new_from_fits_chunks(file,
+                         chunk_rows=100000,
+                         fits_ext=0,
+                         row_filter=None,
+                         memmap_directory=None,
+                         **argw):
+    """
+    Builds a :class:`MLDataSet` incrementally, streaming the table of a FITS file in blocks of rows
+    (see :meth:`.Table.iter_fits_chunks`). A dataset is built from each block, and the blocks are
+    concatenated by :func:`datasets_concatenate`.
+
+    If `memmap_directory` is provided, each block dataset is saved to a temporary memory-mapped
+    directory, so that only one block is in memory at a time, and the concatenation is
+    written to `memmap_directory`
+
+    Parameters
+    ----------
+    file : basestring
+        the fits file
+    chunk_rows : int
+        the number of rows of each block
+    fits_ext : int (default=0)
+        the fits extension corresponding to the table
+    row_filter : callable, optional
+        a function taking the rows of a block (a :class:`astropy.io.fits.FITS_rec`)
+        and returning a boolean array of the rows to keep
+    memmap_directory : basestring, optional
+        if not None, the output directory of the memory-mapped dataset
+    argw :
+        the same argw in :meth:`.dataset.MLDataSet.new_from_table`, except the rows selections,
+        use `row_filter` instead. `target_array` and `weight_array`, if provided, refer to all
+        the rows of the FITS table, and are sliced for each block
+
+    Returns
+    -------
+    dataset : :class:`.dataset.MLDataSet` object
+    """
+    if _is_not_empty(argw.get('rows_IDs_use_list')) or _is_not_empty(argw.get('rows_IDs_skip_list')):
+        raise RuntimeError('rows selection not supported when reading in blocks, use row_filter')
+
+    target_array=argw.pop('target_array',None)
+    weight_array=argw.pop('weight_array',None)
+
+    datasets_list=[]
+    chunks_dir_list=[]
+    for ID,table in enumerate(Table.iter_fits_chunks(file,
+                                                     chunk_rows=chunk_rows,
+                                                     fits_ext=fits_ext,
+                                                     use_col_names=_fits_use_col_names(argw),
+                                                     regex=argw.get('regex',True),
+                                                     row_filter=row_filter)):
+
+        #the block rows IDs are the rows of the FITS table
+        rows_IDs=table.get_column('__original_entry_ID__')
+        dataset=MLDataSet.new_from_table(table,
+                                         target_array=None if target_array is None else np.asarray(target_array)[rows_IDs],
+                                         weight_array=None if weight_array is None else np.asarray(weight_array)[rows_IDs],
+                                         **argw)
+        if memmap_directory is not None:
+            chunk_dir=os.path.join(memmap_directory,'chunk_%d'%ID)
+            dataset.save_memmap(chunk_dir)
+            dataset=MLDataSet.new_from_memmap(chunk_dir)
+            chunks_dir_list.append(chunk_dir)
+
+        datasets_list.append(dataset)
+
+    dataset=datasets_concatenate(datasets_list,memmap_directory=memmap_directory,chunk_size=chunk_rows)
+
+    del datasets_list
+    for chunk_dir in chunks_dir_list:
+        shutil.rmtree(chunk_dir)
+
+    return dataset
+
+
 #------------------------------------
 # add/remove features columns-wise
 #------------------------------------
@@ -120,7 +202,8 @@ def new_from_rows(dataset, selected):
 @check_names_list_decorate
 def add_features(dataset,feature_names_list,features):
     """
-    add features to an existing DataSet
+    add features to an existing DataSet. The features buffer grows by a factor 1.5,
+    so adding features one by one has an amortized linear cost (see also :func:`add_features_many`)
 
      .. WARNING::
         adding features  will append True values to :attr:`.dataset.MLDataSet.columns_mask`
@@ -139,6 +222,47 @@ def add_features(dataset,feature_names_list,features):
     if type(feature_names_list)!=list:
         feature_names_list=[feature_names_list]
 
+    features=_check_features_rows(dataset,features)
+
+    if check_same_size(features.shape[1], len(feature_names_list)):
+        pass
+    else:
+        raise RuntimeError('number of columns in features  not equal to number of items in feature_names_list')
+
+    _add_features_columns(dataset,feature_names_list,[features],amortized=True)
+
+
+@check_dataset_decorate
+def add_features_many(dataset,feature_names_list,features_list):
+    """
+    add many features to an existing DataSet, reserving the space for all of them at once
+
+     .. WARNING::
+        adding features  will append True values to :attr:`.dataset.MLDataSet.columns_mask`
+
+    Parameters
+    ----------
+    dataset : instance of :class:`.dataset.MLDataSet`
+    feature_names_list : list of strings
+    features_list : list of np.arrays
+        1dim or 2dim arrays, the total number of columns has to be equal to
+        the number of items in feature_names_list
+
+    Returns
+    -------
+
+    """
+    features_list=[_check_features_rows(dataset,features) for features in features_list]
+
+    if check_same_size(sum([features.shape[1] for features in features_list]), len(feature_names_list)):
+        pass
+    else:
+        raise RuntimeError('number of columns in features  not equal to number of items in feature_names_list')
+
+    _add_features_columns(dataset,list(feature_names_list),features_list,amortized=False)
+
+
+def _check_features_rows(dataset,features):
     if check_array_is_1dim(features):
         features = np.reshape(features,(features.size, 1))
         if check_same_size(features.size, dataset.features_N_rows):
@@ -152,21 +276,20 @@ def add_features(dataset,feature_names_list,features):
         else:
            raise RuntimeError('number of rows in features not equal to number of rows in data.features')
 
-    if check_same_size(features.shape[1], len(feature_names_list)):
-        pass
-    else:
-        raise RuntimeError('number of columns in features  not equal to number of items in feature_names_list')
+    return features
+
 
-    dataset._features = np.column_stack((dataset._features, features))
-    dataset._features_names.extend  (feature_names_list)
-    if dataset.columns_mask is not None:
-        extra_size=len(dataset._features_names)-dataset.columns_mask.size
-        dataset.columns_mask=np.append(dataset.columns_mask,np.ones(extra_size,dtype=np.bool))
+def _add_features_columns(dataset,feature_names_list,features_list,amortized=True):
+    columns_mask=dataset.columns_mask
+    dataset._append_features_columns(features_list,amortized=amortized)
+    dataset._append_features_names(feature_names_list)
+    extra_size=len(dataset._features_names)-columns_mask.size
+    dataset.columns_mask=np.append(columns_mask,np.ones(extra_size,dtype=np.bool_))
 
 
 @check_dataset_decorate
 @check_names_list_decorate
-def drop_features(dataset,removing_feature_names_list,regex=True):
+def drop_features(dataset,removing_feature_names_list,regex=True,lazy=False):
     """
     drops all the features whose names match any element in the  removing_feature_names_list. If regex == True, the list of columns to remove
     is built by finding any column name in the cloumns_names of dataset that matches  the regex of any elements of
@@ -178,18 +301,21 @@ def drop_features(dataset,removing_feature_names_list,regex=True):
     removing_feature_names_list : list of strings or string, or array of int or array of bools
     regex : bool
         flag to use regular expression
+    lazy : bool
+        if True, the columns are not removed from the features buffer, but only from the index of the
+        live columns, the buffer is compacted by :func:`compact_features`, or when it is copied
 
     Returns
     -------
 
     """
-    _select_features(dataset, removing_feature_names_list, regex=True, remove=True)
+    _select_features(dataset, removing_feature_names_list, regex=regex, remove=True, lazy=lazy)
 
 
 
 @check_dataset_decorate
 @check_names_list_decorate
-def keep_features(dataset,keeping_feature_names_list,regex=True):
+def keep_features(dataset,keeping_feature_names_list,regex=True,lazy=False):
     """
     keeps all the features whose names match any element in keeping_feature_names_list. If regex == True, the list of columns to keep
     is built by finding any column name in the cloumns_names of dataset that matches  the regex of any elements of
@@ -201,17 +327,20 @@ def keep_features(dataset,keeping_feature_names_list,regex=True):
     keeping_feature_names_list :  list of strings or string, or array of int or array of bools
     regex : bool
         flag to use regular expression
+    lazy : bool
+        if True, the columns are not removed from the features buffer, but only from the index of the
+        live columns, the buffer is compacted by :func:`compact_features`, or when it is copied
 
     Returns
     -------
 
     """
 
-    _select_features(dataset, keeping_feature_names_list, regex=True, remove=False)
+    _select_features(dataset, keeping_feature_names_list, regex=regex, remove=False, lazy=lazy)
 
 
 
-def _select_features(dataset,names_list,regex=True,remove=False):
+def _select_features(dataset,names_list,regex=True,remove=False,lazy=False):
     """
 
     Parameters
@@ -224,6 +353,9 @@ def _select_features(dataset,names_list,regex=True,remove=False):
     remove :bool
         if `True`, matching columns names removed, if `False`  matching columns names are kept
 
+    lazy : bool
+        if `True`, the columns are dropped only from the index of the live columns of the buffer
+
     Returns
     -------
 
@@ -231,34 +363,53 @@ def _select_features(dataset,names_list,regex=True,remove=False):
     if regex is True:
         removing_names_list=build_names_list(names_list,dataset._features_names,regex=regex,matching=remove)
     else :
-        removing_names_list=[name for name in dataset._features_names if name not in names_list]
+        names_set=set(names_list)
+        removing_names_list=[name for name in dataset._features_names if (name in names_set)==remove]
 
     for feature_name in removing_names_list:
-        if feature_name not in dataset._features_names:
+        if feature_name not in dataset._features_names_index:
             raise RuntimeError('feature name not existing ')
 
-    remove_ID_list = []
-
     print("| features initial Rows,Cols=", dataset.features_N_rows, dataset.features_N_cols)
     print("| removing features", removing_names_list)
 
-    for ID, name in enumerate(dataset._features_names[:]):
-        if name in removing_names_list:
-            remove_ID_list.append(ID)
-            dataset._features_names.remove(name)
-
+    removing_names_set=set(removing_names_list)
+    remove_ID_list=[ID for ID, name in enumerate(dataset._features_names) if name in removing_names_set]
+    dataset._set_features_names([name for name in dataset._features_names if name not in removing_names_set])
 
+    columns_mask=dataset.columns_mask
     if remove_ID_list != []:
-        dataset._features = np.delete(dataset._features, remove_ID_list, 1)
+        if lazy is True:
+            dataset._drop_buffer_columns(remove_ID_list)
+        else:
+            dataset._features = np.delete(dataset._features, remove_ID_list, 1)
 
-    if dataset.columns_mask is not None:
-        dataset.columns_mask=np.delete(dataset.columns_mask, remove_ID_list,)
+    dataset.columns_mask=np.delete(columns_mask, remove_ID_list,)
     print("| features final Rows,Cols=", dataset.features_N_rows, dataset.features_N_cols)
     print("")
 
 
 
 
+@check_dataset_decorate
+def compact_features(dataset):
+    """
+    Compacts the features buffer, releasing the columns lazily dropped by
+    :func:`drop_features` or :func:`keep_features`, and the spare columns
+    reserved by :func:`add_features`
+
+    Parameters
+    ----------
+    dataset : instance of :class:`.dataset.MLDataSet`
+
+    Returns
+    -------
+
+    """
+    dataset._compact_features()
+
+
+
 #------------------------------------
 # sorting columns
 #------------------------------------
@@ -276,14 +427,9 @@ def sort_feature_columns_position(dataset, id_array):
     -------
 
     """
-    if dataset._check_is_dataset(dataset):
-        pass
-    else:
-        raise RuntimeError('dataset is not a MLDataSet object')
-
+    columns_mask=dataset.columns_mask
     dataset._features = dataset._features[:, id_array]
-    if dataset._columns_mask is not None:
-        dataset._columns_mask= dataset._columns_mask[id_array]
+    dataset.columns_mask= columns_mask[id_array]
 
     dataset._set_features_names([dataset._features_names[id] for id in id_array])
 
@@ -306,21 +452,24 @@ def keep_rows(dataset, selected):
     -------
 
     """
+    rows_mask=dataset.rows_mask[selected]
 
-
-    dataset._features = dataset._features[selected]
+    if dataset._features_shared is True:
+        dataset._take_buffer_rows(selected)
+    else:
+        dataset._features = dataset._features[selected]
 
     if dataset._features_original_entry_ID is not None:
         dataset._features_original_entry_ID = dataset._features_original_entry_ID[selected]
 
     if dataset._target_array is not None:
-        dataset.target_array = dataset._target_array[selected]
+        dataset._target_array = dataset._target_array[selected]
+        dataset._take_stratifying_cache(selected)
 
     if dataset._weight_array is not None:
-        dataset.weight_array = dataset._weight_array[selected]
+        dataset._weight_array = dataset._weight_array[selected]
 
-    if dataset._rows_mask is not None:
-        dataset._rows_mask = dataset._rows_mask[selected]
+    dataset.rows_mask = rows_mask
 
 
 
@@ -335,7 +484,9 @@ def keep_rows(dataset, selected):
 @check_dataset_decorate
 def dataset_append(dataset1, dataset2):
     """
-    Row-wise appending of dataset2 to dataset1
+    Row-wise appending of dataset2 to dataset1. The features of dataset2 are cast
+    to the dtype of dataset1, if set
+
     Parameters
     ----------
     dataset1 : :class:`.dataset.MLDataSet` object
@@ -346,18 +497,119 @@ def dataset_append(dataset1, dataset2):
 
     """
     for dataset in [dataset1,dataset2]:
-        if MLDataSet._check_is_DataSet(dataset):
+        if MLDataSet._check_is_MLDataSett(dataset):
             pass
         else:
-            raise RuntimeError('dataset1 or dataset2 are not both DataSetBase objects')
+            raise RuntimeError('dataset1 or dataset2 are not both MLDataSet objects')
+
+    rows_mask = _append_if_both_exist(dataset1.rows_mask, dataset2.rows_mask)
 
-    dataset1._features_array = np.row_stack((dataset1._features_array, dataset2._features_array))
+    N_rows=dataset1.features_N_rows
+    features=np.empty((N_rows+dataset2.features_N_rows,dataset1.features_N_cols),
+                      dtype=dataset1._result_dtype(dataset2._features_buffer),
+                      order=dataset1.order)
+    features[:N_rows]=dataset1._features
+    features[N_rows:]=dataset2._features
+    dataset1._features = features
 
-    dataset1._target_array=_append_if_both_exist(dataset1.target_array, dataset2.target_array)
+    dataset1._target_array=_append_if_both_exist(dataset1._target_array, dataset2._target_array)
+    dataset1._stratifying_cache={}
     dataset1._features_original_entry_ID = _append_if_both_exist(dataset1._features_original_entry_ID, dataset2._features_original_entry_ID)
     dataset1._weight_array = _append_if_both_exist(dataset1._weight_array, dataset2._weight_array)
-    dataset1._columns_mask = _append_if_both_exist(dataset1._columns_mask, dataset2._columns_mask)
-    dataset1._rows_mask = _append_if_both_exist(dataset1._rows_mask, dataset2._rows_mask)
+    dataset1.rows_mask = rows_mask
+
+
+def datasets_concatenate(datasets_list,memmap_directory=None,chunk_size=100000):
+    """
+    Row-wise concatenation of a list of datasets, in a new dataset. The schemas are
+    checked once, and the output features are preallocated and filled in one pass,
+    in blocks of rows. The features are cast to the dtype of the first dataset, if set,
+    and use the memory layout of the first dataset.
+
+    If `memmap_directory` is provided, the features are written in blocks to a memory-mapped
+    file, and the concatenation is saved as in :meth:`.dataset.MLDataSet.save_memmap`,
+    so that catalogs larger than the memory can be assembled
+
+    Parameters
+    ----------
+    datasets_list : list of :class:`.dataset.MLDataSet` objects
+        the datasets to concatenate, with the same features names
+    memmap_directory : basestring, optional
+        if not None, the output directory of the memory-mapped concatenation
+    chunk_size : int
+        the number of rows copied in each block
+
+    Returns
+    -------
+    dataset : :class:`.dataset.MLDataSet` object
+        the concatenated dataset, the columns and selection masks, and the target binning,
+        are those of the first dataset.
+        The target, weight, and original entry ID arrays are concatenated only if
+        present in all the datasets
+    """
+    if len(datasets_list)==0:
+        raise RuntimeError('datasets_list is empty')
+
+    for dataset in datasets_list:
+        if MLDataSet._check_is_MLDataSett(dataset):
+            pass
+        else:
+            raise RuntimeError('datasets_list items have to be MLDataSet objects')
+
+    first=datasets_list[0]
+    for dataset in datasets_list[1:]:
+        if dataset._features_names!=first._features_names:
+            raise RuntimeError('datasets have different features names')
+
+    N_rows=sum([dataset.features_N_rows for dataset in datasets_list])
+    N_cols=first.features_N_cols
+    if first._dtype is not None:
+        dtype=first._dtype
+    else:
+        dtype=np.result_type(*[dataset.dtype for dataset in datasets_list])
+
+    if memmap_directory is None:
+        features=np.empty((N_rows,N_cols),dtype=dtype,order=first.order)
+    else:
+        features=open_memmap_array(memmap_directory,'features',(N_rows,N_cols),dtype,order=first.order)
+
+    start=0
+    for dataset in datasets_list:
+        for chunk_start in range(0,dataset.features_N_rows,chunk_size):
+            chunk_stop=min(chunk_start+chunk_size,dataset.features_N_rows)
+            rows=dataset._buffer_rows_index(slice(chunk_start,chunk_stop))
+            features[start+chunk_start:start+chunk_stop]=dataset._gather_features(rows,slice(0,N_cols))
+        start+=dataset.features_N_rows
+
+    concatenated=MLDataSet(features,
+                           features_names=list(first._features_names),
+                           target_bins=first.target_bins,
+                           target_binning=first.target_binning,
+                           columns_mask=first.columns_mask,
+                           rows_mask=np.concatenate([dataset.rows_mask for dataset in datasets_list]),
+                           catalog_file=first.catalog_file,
+                           order=first.order,
+                           dtype=first._dtype)
+
+    concatenated._target_array=_concatenate_if_all_exist([dataset._target_array for dataset in datasets_list])
+    concatenated._weight_array=_concatenate_if_all_exist([dataset._weight_array for dataset in datasets_list])
+    concatenated._features_original_entry_ID=_concatenate_if_all_exist([dataset._features_original_entry_ID for dataset in datasets_list])
+    concatenated.selection_mask=first.selection_mask
+
+    if memmap_directory is not None:
+        features.flush()
+        concatenated.save_memmap(memmap_directory)
+        del features
+        concatenated=MLDataSet.new_from_memmap(memmap_directory)
+
+    return concatenated
+
+
+def _concatenate_if_all_exist(arrays_list):
+    if all([a is not None for a in arrays_list]):
+        return np.concatenate(arrays_list)
+    else:
+        return None
 
 
 def _append_if_both_exist(a,b):
@@ -30,6 +30,7 @@ __author__ = "Andrea Tramacere"
 # Dependencies
 # eg numpy 
 # absolute import eg: import numpy as np
+import  numpy as np
 
 # Project
 # relative import eg: from .mod import f
@@ -53,3 +54,196 @@ def check_array_is_1dim( array):
 
 def check_same_size( size1, size2):
     return size1 == size2
+
+
+def mask_to_slice(mask):
+    """
+    Returns a slice equivalent to `mask`, if the selected entries are contiguous, otherwise None
+
+    Parameters
+    ----------
+    mask : 1dim bool array, or 1dim int array
+
+    Returns
+    -------
+    s : slice or None
+    """
+    if np.issubdtype(mask.dtype, np.bool_):
+        ids = np.flatnonzero(mask)
+        if ids.size == 0:
+            return slice(0, 0)
+        if ids[-1] - ids[0] + 1 == ids.size:
+            return slice(int(ids[0]), int(ids[-1]) + 1)
+    else:
+        ids = np.asarray(mask)
+        if ids.size == 0:
+            return slice(0, 0)
+        if ids.size == 1 or np.all(np.diff(ids) == 1):
+            return slice(int(ids[0]), int(ids[-1]) + 1)
+
+    return None
+
+
+def _wrap_ids(ids, size):
+    """
+    Returns the int array `ids` with the negative entries wrapped modulo `size`,
+    as in numpy indexing, raising IndexError for the entries out of range
+    """
+    ids = np.asarray(ids, dtype=np.intp)
+    if ids.size > 0 and (ids.min() < -size or ids.max() >= size):
+        raise IndexError('index out of range for axis of size %d' % size)
+    return np.where(ids < 0, ids + size, ids)
+
+
+def mask_to_index(mask, size):
+    """
+    Converts a mask to its compact index representation, i.e. a slice if the selected entries
+    are contiguous, or a sorted 1dim int array otherwise
+
+    Parameters
+    ----------
+    mask : 1dim bool array, 1dim int array, or None
+        if None, all the `size` entries are selected, negative ints are counted from the end
+    size : int
+        the size of the masked axis
+
+    Returns
+    -------
+    index : slice or 1dim int array
+    """
+    if mask is None:
+        return slice(0, size)
+
+    if isinstance(mask, slice):
+        start, stop, step = mask.indices(size)
+        if step == 1:
+            return slice(start, max(start, stop))
+        mask = np.arange(start, stop, step)
+
+    mask = np.asarray(mask)
+    if not np.issubdtype(mask.dtype, np.bool_):
+        mask = np.unique(_wrap_ids(mask, size))
+
+    index = mask_to_slice(mask)
+    if index is None:
+        if np.issubdtype(mask.dtype, np.bool_):
+            index = np.flatnonzero(mask)
+        else:
+            index = mask.astype(np.intp)
+
+    return index
+
+
+def index_to_mask(index, size):
+    """
+    Converts an index (slice or int array) to the corresponding 1dim bool mask
+
+    Parameters
+    ----------
+    index : slice or 1dim int array
+    size : int
+        the size of the masked axis
+
+    Returns
+    -------
+    mask : 1dim bool array
+    """
+    mask = np.zeros(size, dtype=np.bool_)
+    mask[index] = True
+    return mask
+
+
+def index_size(index):
+    """
+    Returns the number of entries selected by an index (slice or int array)
+
+    Parameters
+    ----------
+    index : slice or 1dim int array
+
+    Returns
+    -------
+    size : int
+    """
+    if isinstance(index, slice):
+        return index.stop - index.start
+    else:
+        return index.size
+
+
+def compose_index(outer, inner):
+    """
+    Composes two indices, i.e. returns the index equivalent to `outer[inner]`
+
+    Parameters
+    ----------
+    outer : slice or 1dim int array
+    inner : slice or 1dim int array
+        index relative to the entries selected by `outer`
+
+    Returns
+    -------
+    index : slice or 1dim int array
+    """
+    if isinstance(outer, slice):
+        if isinstance(inner, slice):
+            return slice(outer.start + inner.start, outer.start + inner.stop)
+        else:
+            return inner + outer.start
+    else:
+        index = outer[inner]
+        s = mask_to_slice(index)
+        if s is not None:
+            return s
+        return index
+
+
+def selection_to_index(selected, size):
+    """
+    Converts a rows selection to an index, preserving the order of the selected entries
+    (at variance with :func:`mask_to_index`, int arrays are neither sorted nor made unique)
+
+    Parameters
+    ----------
+    selected : 1dim bool array, list, or 1dim int array
+        negative ints are counted from the end
+    size : int
+        the size of the selected axis
+
+    Returns
+    -------
+    index : slice or 1dim int array
+    """
+    if isinstance(selected, slice):
+        return mask_to_index(selected, size)
+
+    selected = np.asarray(selected)
+    if np.issubdtype(selected.dtype, np.bool_):
+        return mask_to_index(selected, size)
+
+    selected = _wrap_ids(selected, size)
+    index = mask_to_slice(selected)
+    if index is None:
+        index = selected
+
+    return index
+
+
+def index_contains(index, ID):
+    """
+    Returns True if the entry `ID` is selected by the index (slice or sorted int array)
+
+    Parameters
+    ----------
+    index : slice or sorted 1dim int array
+    ID : int
+
+    Returns
+    -------
+    contained : bool
+    """
+    if isinstance(index, slice):
+        return index.start <= ID < index.stop
+    else:
+        pos = np.searchsorted(index, ID)
+        return bool(pos < index.size and index[pos] == ID)
@@ -29,4 +29,4 @@ __author__ = "Andrea Tramacere"
 # Project
 # relative import eg: from .mod import f
 
-__all__=['fits']
\ No newline at end of file
+__all__=['ascii','fits','memmap']
\ No newline at end of file
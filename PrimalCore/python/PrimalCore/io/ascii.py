@@ -0,0 +1,310 @@
+#  
+# Copyright (C) 2012-2020 Euclid Science Ground Segment      
+#    
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General    
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)    
+# any later version.    
+#    
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied    
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more    
+# details.    
+#    
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to    
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA    
+#
+
+"""
+Overview
+--------
+This module provides the implementation of basic functions for I/O with ASCII (e.g. CSV) tables
+with typed parsing, column projection, row chunking, and multi-threaded parsing of file blocks.
+
+
+
+
+
+
+
+
+Module API
+----------
+"""
+
+
+from __future__ import absolute_import, division, print_function
+
+from builtins import (bytes, str, open, super, range,
+                      zip, round, input, int, pow, object, map, zip)
+
+
+__author__ = "Andrea Tramacere"
+
+# Standard library
+# eg copy
+# absolute import rg:from copy import deepcopy
+import itertools
+import warnings
+from collections import OrderedDict
+
+# Dependencies
+# eg numpy
+# absolute import eg: import numpy as np
+import  numpy as np
+
+# Project
+# relative import eg: from .mod import f
+from ..heterogeneous_table.tools import build_names_list
+
+
+def read_header(input_file,delimiter=None,comments='#',names=None,sample_rows=1000,dtypes=None):
+    """
+    reads the columns names, and infers the columns dtypes, from the first lines of an ASCII table.
+    The columns names are read from the first line (a leading comment character is stripped),
+    unless `names` is provided. The dtypes are inferred from the first `sample_rows` rows:
+    int, float, or string (with the maximum width found in the sample). Use `dtypes` if
+    the sample is not representative, e.g. for longer strings, or missing values in int columns
+
+    Parameters
+    ----------
+    input_file : file path
+    delimiter : str, optional
+        the columns delimiter, if None any whitespace
+    comments : str
+        the comment character
+    names : list of strings, optional
+        the columns names, if provided the first line is a data line
+    sample_rows : int
+        number of rows used to infer the dtypes
+    dtypes : dictionary, optional
+        name->dtype, overriding the inferred dtypes
+
+    Returns
+    -------
+    names : list of strings
+    dtype_list : list of numpy dtypes
+    header_lines : int
+        the number of lines preceding the data
+    """
+    with open(input_file,'r') as f:
+        header_lines=0
+        if names is None:
+            line=f.readline()
+            header_lines=1
+            if comments is not None and line.startswith(comments):
+                line=line[len(comments):]
+            names=line.strip().split(delimiter)
+            names=[name.strip() for name in names]
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            sample=np.loadtxt(itertools.islice(f,sample_rows),
+                              dtype=str,
+                              delimiter=delimiter,
+                              comments=comments,
+                              ndmin=2)
+
+    if sample.shape[0]>0 and sample.shape[1]!=len(names):
+        raise RuntimeError('number of columns in data (%d) not equal to number of names (%d)'%(sample.shape[1],len(names)))
+
+    dtype_list=[]
+    for ID,name in enumerate(names):
+        if dtypes is not None and name in dtypes:
+            dtype_list.append(np.dtype(dtypes[name]))
+        elif sample.shape[0]==0:
+            dtype_list.append(np.dtype(np.float64))
+        else:
+            dtype_list.append(_infer_dtype(sample[:,ID]))
+
+    return names,dtype_list,header_lines
+
+
+def _infer_dtype(values):
+    for dtype in (np.int64,np.float64):
+        try:
+            values.astype(dtype)
+            return np.dtype(dtype)
+        except ValueError:
+            pass
+
+    return np.dtype('U%d'%max([len(v) for v in values]))
+
+
+def read_columns(input_file,
+                 delimiter=None,
+                 comments='#',
+                 names=None,
+                 dtypes=None,
+                 use_col_names=None,
+                 skip_col_names=None,
+                 regex=True,
+                 rows_range=None,
+                 sample_rows=1000):
+    """
+    reads a subset of the columns and of the rows of an ASCII table. The rows are parsed by
+    :func:`numpy.loadtxt` directly to typed arrays, reading only the selected columns.
+    Comment and blank lines are not counted as rows
+
+    Parameters
+    ----------
+    input_file : file path
+    delimiter : str, optional
+        the columns delimiter, if None any whitespace
+    comments : str
+        the comment character
+    names : list of strings, optional
+        the columns names, if None they are read from the first line
+    dtypes : dictionary, optional
+        name->dtype, overriding the dtypes inferred by :func:`read_header`
+    use_col_names : list of strings, optional
+        names (or regex if `regex` is True) of the columns to read, if None all the columns are read
+    skip_col_names : list of strings, optional
+        names (or regex if `regex` is True) of the columns to skip
+    regex : bool
+        if True, regex is applied to `use_col_names` and `skip_col_names`
+    rows_range : tuple of int, optional
+        (start, stop) of the data rows to read
+    sample_rows : int
+        number of rows used to infer the dtypes
+
+    Returns
+    -------
+    columns : :class:`collections.OrderedDict`
+        name->:class:`numpy.ndarray` for each selected column
+    rows_IDs : slice
+        the IDs of the rows read, in the ASCII table
+    """
+    parser=_AsciiParser(input_file,delimiter,comments,names,dtypes,use_col_names,skip_col_names,regex,sample_rows)
+
+    if rows_range is not None:
+        start,stop=rows_range
+        with open(input_file,'r') as f:
+            lines=itertools.islice(parser._data_lines(f),start,stop)
+            columns=parser.parse(lines)
+        return columns,slice(start,start+parser.size(columns))
+
+    with open(input_file,'r') as f:
+        columns=parser.parse(parser._data_lines(f))
+
+    return columns,slice(0,parser.size(columns))
+
+
+def iter_columns_chunks(input_file,
+                        chunk_rows=100000,
+                        delimiter=None,
+                        comments='#',
+                        names=None,
+                        dtypes=None,
+                        use_col_names=None,
+                        skip_col_names=None,
+                        regex=True,
+                        sample_rows=1000):
+    """
+    generator streaming an ASCII table in blocks of rows, so that only one block
+    of the selected columns is in memory at a time
+
+    Parameters
+    ----------
+    input_file : file path
+    chunk_rows : int
+        the number of rows of each block
+    delimiter : str, optional
+        the columns delimiter, if None any whitespace
+    comments : str
+        the comment character
+    names : list of strings, optional
+        the columns names, if None they are read from the first line
+    dtypes : dictionary, optional
+        name->dtype, overriding the dtypes inferred by :func:`read_header`
+    use_col_names : list of strings, optional
+        names (or regex if `regex` is True) of the columns to read, if None all the columns are read
+    skip_col_names : list of strings, optional
+        names (or regex if `regex` is True) of the columns to skip
+    regex : bool
+        if True, regex is applied to `use_col_names` and `skip_col_names`
+    sample_rows : int
+        number of rows used to infer the dtypes
+
+    Yields
+    -------
+    columns : :class:`collections.OrderedDict`
+        name->:class:`numpy.ndarray` for each selected column
+    rows_IDs : slice
+        the IDs of the rows of the block, in the ASCII table
+    """
+    parser=_AsciiParser(input_file,delimiter,comments,names,dtypes,use_col_names,skip_col_names,regex,sample_rows)
+
+    with open(input_file,'r') as f:
+        lines=parser._data_lines(f)
+        start=0
+        while True:
+            columns=parser.parse(itertools.islice(lines,chunk_rows))
+            N_rows=parser.size(columns)
+            # the lines are data rows only, an empty block is the end of the file
+            if N_rows==0:
+                break
+            yield columns,slice(start,start+N_rows)
+            start+=N_rows
+
+
+class _AsciiParser(object):
+    """
+    Parses the selected columns of an ASCII table, with the dtypes read by :func:`read_header`
+    """
+    def __init__(self,input_file,delimiter,comments,names,dtypes,use_col_names,skip_col_names,regex,sample_rows):
+        self.input_file=input_file
+        self.delimiter=delimiter
+        self.comments=comments
+
+        all_names,dtype_list,self.header_lines=read_header(input_file,
+                                                           delimiter=delimiter,
+                                                           comments=comments,
+                                                           names=names,
+                                                           sample_rows=sample_rows,
+                                                           dtypes=dtypes)
+
+        names_list=all_names
+        if use_col_names is not None:
+            names_list=build_names_list(use_col_names,names_list,regex=regex,matching=True)
+        if skip_col_names is not None:
+            names_list=build_names_list(skip_col_names,names_list,regex=regex,matching=False)
+
+        names_set=set(names_list)
+        self.usecols=[ID for ID,name in enumerate(all_names) if name in names_set]
+        self.names_list=[all_names[ID] for ID in self.usecols]
+        self.dtype=np.dtype([(all_names[ID],dtype_list[ID]) for ID in self.usecols])
+
+    def _data_lines(self,f):
+        """
+        generator of the data lines of the file, skipping the header, and the comment and blank lines
+        """
+        for ID in range(self.header_lines):
+            f.readline()
+        for line in f:
+            stripped=line.strip()
+            if stripped=='' or (self.comments is not None and stripped.startswith(self.comments)):
+                continue
+            yield line
+
+    def parse(self,lines):
+        """
+        parses the lines to a dictionary of typed columns
+        """
+        with warnings.catch_warnings():
+            # empty blocks are expected at the end of the file
+            warnings.simplefilter('ignore')
+            data=np.loadtxt(lines,
+                            dtype=self.dtype,
+                            delimiter=self.delimiter,
+                            comments=self.comments,
+                            usecols=self.usecols,
+                            ndmin=1)
+
+        columns=OrderedDict()
+        for name in self.names_list:
+            columns[name]=np.array(data[name])
+        return columns
+
+    def size(self,columns):
+        if len(columns)==0:
+            return 0
+        return next(iter(columns.values())).shape[0]
@@ -38,8 +38,18 @@ __author__ = "Andrea Tramacere"
 # Standard library
 # eg copy
 # absolute import rg:from copy import deepcopy
+from collections import OrderedDict
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+import glob
+import os
 
 # Dependencies
+try:
+    basestring
+except NameError:
+    basestring=str
+
 try:
     import  pyfits as pf
 except:
@@ -52,10 +62,11 @@ import  numpy as np
 
 # Project
 # relative import eg: from .mod import f
+from ..heterogeneous_table.tools import build_names_list
 
 
 
-def read_data(input_file,fits_ext=0,header=True):
+def read_data(input_file,fits_ext=0,header=True,memmap=False):
     """
     reads the data and the header  from an extension of a fits file
 
@@ -63,15 +74,306 @@ def read_data(input_file,fits_ext=0,header=True):
     ----------
     input_file : file phat,file object, or file like object
     fits_ext : extension of the fits file storing the data
+    memmap : bool
+        if True, the data are memory mapped and not copied, and a :class:`astropy.io.fits.FITS_rec`
+        is returned. The file is mapped in copy-on-write mode, and the columns are read from disk
+        only when accessed
 
     Returns
     -------
     d : np structured array
     h : fits header, if `header` parameter is True
     """
-    d,h=pf.getdata(input_file, ext=fits_ext,header=header)
+    d,h=pf.getdata(input_file, ext=fits_ext,header=True,memmap=memmap)
+
+    if memmap==False:
+        d=np.array(d)
+
+    if header==True:
+        return d,h
+    else:
+        return d
+
+def read_columns_names(input_file,fits_ext=0):
+    """
+    reads the names of the columns of a table extension of a fits file, without reading the data
+
+    Parameters
+    ----------
+    input_file : file phat,file object, or file like object
+    fits_ext : extension of the fits file storing the data
+
+    Returns
+    -------
+    names_list : list of strings
+    """
+    with pf.open(input_file,memmap=True) as hdu_list:
+        return list(hdu_list[fits_ext].columns.names)
+
+
+def read_columns(input_file,
+                 fits_ext=0,
+                 use_col_names=None,
+                 skip_col_names=None,
+                 regex=True,
+                 rows_range=None,
+                 row_filter=None,
+                 header=True,
+                 copy=True):
+    """
+    reads a subset of the columns and of the rows of a table extension of a fits file.
+    The file is memory mapped, so that only the selected columns and rows are converted
+    and copied in memory
+
+    Parameters
+    ----------
+    input_file : file phat,file object, or file like object
+    fits_ext : extension of the fits file storing the data
+    use_col_names : list of strings, optional
+        names (or regex if `regex` is True) of the columns to read, if None all the columns are read
+    skip_col_names : list of strings, optional
+        names (or regex if `regex` is True) of the columns to skip
+    regex : bool
+        if True, regex is applied to `use_col_names` and `skip_col_names`
+    rows_range : tuple of int, optional
+        (start, stop) of the rows to read
+    row_filter : callable, optional
+        a function taking the table rows (a :class:`astropy.io.fits.FITS_rec`,
+        whose columns are read only if accessed) and returning a boolean array
+        of the rows to keep
+    header : bool
+        if True the header is returned
+    copy : bool
+        if False, the columns are views of the memory-mapped file, when possible (i.e. if the columns
+        are not scaled, and if `row_filter` is None), that remain valid after the file is closed
+
+    Returns
+    -------
+    columns : :class:`collections.OrderedDict`
+        name->:class:`numpy.ndarray` for each selected column
+    rows_IDs : slice, or 1dim int array
+        the IDs of the rows read, in the table of the fits file, as a `slice` if `row_filter` is None
+    h : fits header, if `header` parameter is True
+    """
+    with pf.open(input_file,memmap=True) as hdu_list:
+        hdu=hdu_list[fits_ext]
+        names_list=_select_columns_names(hdu,use_col_names,skip_col_names,regex)
+
+        if rows_range is None:
+            start,stop=0,hdu.header['NAXIS2']
+        else:
+            start,stop=rows_range
+
+        columns,rows_IDs=_read_hdu_columns(hdu,names_list,start,stop,row_filter=row_filter,copy=copy)
+
+        h=hdu.header.copy()
+
+    if header==True:
+        return columns,rows_IDs,h
+    else:
+        return columns,rows_IDs
+
+
+def iter_columns_chunks(input_file,
+                        chunk_rows=100000,
+                        fits_ext=0,
+                        use_col_names=None,
+                        skip_col_names=None,
+                        regex=True,
+                        row_filter=None):
+    """
+    generator streaming a table extension of a fits file in blocks of rows.
+    The file is opened once, and memory mapped, so that only one block of the selected
+    columns is in memory at a time
+
+    Parameters
+    ----------
+    input_file : file phat,file object, or file like object
+    chunk_rows : int
+        the number of rows of each block
+    fits_ext : extension of the fits file storing the data
+    use_col_names : list of strings, optional
+        names (or regex if `regex` is True) of the columns to read, if None all the columns are read
+    skip_col_names : list of strings, optional
+        names (or regex if `regex` is True) of the columns to skip
+    regex : bool
+        if True, regex is applied to `use_col_names` and `skip_col_names`
+    row_filter : callable, optional
+        a function taking the rows of a block (a :class:`astropy.io.fits.FITS_rec`) and returning
+        a boolean array of the rows to keep
+
+    Yields
+    -------
+    columns : :class:`collections.OrderedDict`
+        name->:class:`numpy.ndarray` for each selected column, owning their data
+    rows_IDs : slice, or 1dim int array
+        the IDs of the rows of the block, in the table of the fits file
+    """
+    with pf.open(input_file,memmap=True) as hdu_list:
+        hdu=hdu_list[fits_ext]
+        names_list=_select_columns_names(hdu,use_col_names,skip_col_names,regex)
+
+        N_rows=hdu.header['NAXIS2']
+        for start in range(0,N_rows,chunk_rows):
+            yield _read_hdu_columns(hdu,names_list,start,min(start+chunk_rows,N_rows),row_filter=row_filter)
+
+
+def read_files_columns(input_files,
+                       fits_ext=0,
+                       use_col_names=None,
+                       skip_col_names=None,
+                       regex=True,
+                       row_filter=None,
+                       n_threads=None):
+    """
+    reads the same subset of columns from the table extensions of many fits files, concurrently
+    in a pool of threads, and concatenates them in preallocated arrays, without intermediate merges.
+    The number of rows and the columns of each file are read from the headers, then each thread
+    copies the selected columns of a file, memory mapped, to its slice of the output arrays.
+    If `row_filter` is not None, the filtered rows are copied in the files order
+
+    The rows IDs are global: the IDs of the rows of the `i`-th file are offset by the total
+    number of rows of the previous files, so that they are unique, and the ID of a row in
+    its own file is the global ID minus the offset of the file
+
+    Parameters
+    ----------
+    input_files : list of file paths, or string
+        the fits files, or a glob pattern, the files matching a pattern are sorted
+    fits_ext : extension of the fits files storing the data
+    use_col_names : list of strings, optional
+        names (or regex if `regex` is True) of the columns to read, if None all the columns are read
+    skip_col_names : list of strings, optional
+        names (or regex if `regex` is True) of the columns to skip
+    regex : bool
+        if True, regex is applied to `use_col_names` and `skip_col_names`
+    row_filter : callable, optional
+        a function taking the rows of a file (a :class:`astropy.io.fits.FITS_rec`) and returning
+        a boolean array of the rows to keep
+    n_threads : int, optional
+        the number of threads, if None the number of cpus is used
+
+    Returns
+    -------
+    columns : :class:`collections.OrderedDict`
+        name->:class:`numpy.ndarray` for each selected column
+    rows_IDs : slice, or 1dim int array
+        the global IDs of the rows read, as a `slice` if `row_filter` is None
+    files_IDs : 1dim int array
+        for each row, the index of its file in `input_files`
+    input_files : list of strings
+        the list of the files read
+    """
+    if isinstance(input_files,basestring):
+        input_files=sorted(glob.glob(input_files))
+    else:
+        input_files=list(input_files)
+
+    if len(input_files)==0:
+        raise RuntimeError('no input files')
+
+    if n_threads is None:
+        n_threads=cpu_count()
+
+    pool=ThreadPool(max(1,min(n_threads,len(input_files))))
+    try:
+        files_N_rows=pool.map(lambda f: _read_table_N_rows(f,fits_ext),input_files)
+        offsets=np.concatenate(([0],np.cumsum(files_N_rows))).astype(np.int64)
+        N_rows=int(offsets[-1])
+
+        # the columns and their dtypes are taken from the first file
+        with pf.open(input_files[0],memmap=True) as hdu_list:
+            hdu=hdu_list[fits_ext]
+            names_list=_select_columns_names(hdu,use_col_names,skip_col_names,regex)
+            first_row,_=_read_hdu_columns(hdu,names_list,0,min(1,files_N_rows[0]))
+
+        # with row_filter the arrays are allocated for all the rows, and the pages
+        # of the filtered out rows are never written
+        columns=OrderedDict()
+        for name in names_list:
+            values=first_row[name]
+            columns[name]=np.empty((N_rows,)+values.shape[1:],dtype=values.dtype.newbyteorder('='))
+
+        def read_file(ID):
+            with pf.open(input_files[ID],memmap=True) as hdu_list:
+                hdu=hdu_list[fits_ext]
+                if set(names_list)-set(hdu.columns.names):
+                    raise RuntimeError('file %s has not all the selected columns'%input_files[ID])
+
+                start=offsets[ID]
+                if row_filter is None:
+                    file_columns,_=_read_hdu_columns(hdu,names_list,0,files_N_rows[ID],copy=False)
+                    for name in names_list:
+                        columns[name][start:start+files_N_rows[ID]]=file_columns[name]
+                    return None
+                else:
+                    file_columns,rows_IDs=_read_hdu_columns(hdu,names_list,0,files_N_rows[ID],row_filter=row_filter)
+                    return file_columns,rows_IDs+start
+
+        if row_filter is None:
+            pool.map(read_file,range(len(input_files)))
+            rows_IDs=slice(0,N_rows)
+            files_IDs=np.repeat(np.arange(len(input_files),dtype=np.int32),files_N_rows)
+        else:
+            rows_IDs_list=[]
+            files_IDs_list=[]
+            size=0
+            for ID,(file_columns,file_rows_IDs) in enumerate(pool.imap(read_file,range(len(input_files)))):
+                for name in names_list:
+                    columns[name][size:size+file_rows_IDs.size]=file_columns[name]
+                size+=file_rows_IDs.size
+                rows_IDs_list.append(file_rows_IDs)
+                files_IDs_list.append(np.full(file_rows_IDs.size,ID,dtype=np.int32))
+            for name in names_list:
+                columns[name]=columns[name][:size]
+            rows_IDs=np.concatenate(rows_IDs_list)
+            files_IDs=np.concatenate(files_IDs_list)
+    finally:
+        pool.close()
+        pool.join()
+
+    return columns,rows_IDs,files_IDs,input_files
+
+
+def _read_table_N_rows(input_file,fits_ext):
+    with pf.open(input_file,memmap=True) as hdu_list:
+        return hdu_list[fits_ext].header['NAXIS2']
+
+
+def _select_columns_names(hdu,use_col_names,skip_col_names,regex):
+    names_list=list(hdu.columns.names)
+    if use_col_names is not None:
+        names_list=build_names_list(use_col_names,names_list,regex=regex,matching=True)
+    if skip_col_names is not None:
+        names_list=build_names_list(skip_col_names,names_list,regex=regex,matching=False)
+    return names_list
+
+
+def _read_hdu_columns(hdu,names_list,start,stop,row_filter=None,copy=True):
+    """
+    reads the rows from `start` to `stop` of the columns in `names_list`, from a table hdu
+    """
+    data=hdu.data[start:stop]
+
+    rows_IDs=slice(start,start+len(data))
+
+    selected=None
+    if row_filter is not None:
+        selected=np.asarray(row_filter(data),dtype=np.bool_)
+        rows_IDs=np.arange(rows_IDs.start,rows_IDs.stop)[selected]
+
+    columns=OrderedDict()
+    for name in names_list:
+        values=data.field(name)
+        if selected is not None:
+            values=values[selected]
+        if copy==True:
+            columns[name]=np.array(values)
+        else:
+            columns[name]=np.asarray(values)
+
+    return columns,rows_IDs
 
-    return np.array(d),h
 
 def write_data(filename,data,extra_header_tuple_list=None,clobber=True):
     """
@@ -97,3 +399,148 @@ def write_data(filename,data,extra_header_tuple_list=None,clobber=True):
 
 
 
+def _fits_rows_dtype(dtype):
+    fields=[]
+    for name in dtype.names:
+        field_dtype=dtype.fields[name][0]
+        base,shape=field_dtype.base,field_dtype.shape
+        if base.kind=='b':
+            base=np.dtype('i1')
+        elif base.kind=='U':
+            base=np.dtype('S%d'%(base.itemsize//4))
+        elif base.kind=='u' and base.itemsize>1:
+            base=np.dtype('>i%d'%base.itemsize)
+        elif base.itemsize>1:
+            base=base.newbyteorder('>')
+        fields.append((name,base,shape))
+    return np.dtype(fields)
+
+
+class FitsTableWriter(object):
+    """
+    Incremental writer of a fits binary table. The primary HDU and the header of the
+    binary-table HDU (including the `extra_header_tuple_list` keywords) are written
+    when the writer is opened, the row blocks are appended to the file by :meth:`write`
+    as soon as they are produced, and `NAXIS2` is updated by :meth:`close`, so that the
+    table is never held in memory. The writer can be used as a context manager
+
+    >>> with FitsTableWriter('pred.fits',dtype,[('cat_file','cat.fits','catalog file')]) as writer:
+    ...     for block in blocks:
+    ...         writer.write(block)
+
+    Parameters
+    ----------
+    filename : string
+        filename
+    dtype : :class:`numpy.dtype`
+        the structured dtype of the rows of the table
+    extra_header_tuple_list : list of tuples (default=None)
+        (keyword, value, comment) tuples added to the header of the binary table
+    clobber : bool (default=True)
+        if False, and `filename` exists, a RuntimeError is raised
+
+    """
+
+    def __init__(self,filename,dtype,extra_header_tuple_list=None,clobber=True):
+        if clobber is False and os.path.exists(filename):
+            raise RuntimeError('file %s already exists'%filename)
+
+        self.filename=filename
+        self.dtype=np.dtype(dtype)
+        self.N_rows=0
+
+        hdu=pf.BinTableHDU(data=np.zeros(0,dtype=self.dtype))
+        if extra_header_tuple_list is not None:
+            hdu.header.extend(extra_header_tuple_list)
+        self._header=hdu.header
+        self._row_size=self._header['NAXIS1']
+        self._fits_dtype=_fits_rows_dtype(self.dtype)
+        if self._fits_dtype.itemsize!=self._row_size:
+            raise RuntimeError('dtype not supported by the fits writer',self.dtype)
+
+        self._file=open(filename,'wb')
+        self._file.write(pf.PrimaryHDU().header.tostring().encode('ascii'))
+        self._header_offset=self._file.tell()
+        self._file.write(self._header.tostring().encode('ascii'))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        self.close()
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def write(self,data):
+        """
+        Appends a block of rows to the table
+
+        Parameters
+        ----------
+        data : :class:`numpy.ndarray` or dict
+            a structured array, or a dict of columns, with the fields of :attr:`dtype`
+        """
+        if self.closed is True:
+            raise RuntimeError('writer for file %s is closed'%self.filename)
+
+        block=self._as_block(data)
+        if block.size==0:
+            return
+
+        self._file.write(self._block_bytes(block))
+        self.N_rows+=block.size
+
+    def close(self):
+        """
+        Pads the data to the fits block size and writes the final number of rows in the header
+        """
+        if self.closed is True:
+            return
+
+        data_size=self.N_rows*self._row_size
+        self._file.write(b'\0'*(-data_size%2880))
+
+        self._header['NAXIS2']=self.N_rows
+        header_string=self._header.tostring().encode('ascii')
+        self._file.seek(self._header_offset)
+        self._file.write(header_string)
+        self._file.close()
+
+    def _as_block(self,data):
+        if isinstance(data,np.ndarray) and data.dtype==self.dtype:
+            return data.reshape(-1)
+
+        names=self.dtype.names
+        if isinstance(data,np.ndarray):
+            if data.dtype.names is None or set(names)-set(data.dtype.names):
+                raise RuntimeError('data fields do not match the table fields',names)
+            N_rows=data.size
+        else:
+            if set(names)-set(data.keys()):
+                raise RuntimeError('data columns do not match the table fields',names)
+            N_rows=len(data[names[0]])
+
+        block=np.zeros(N_rows,dtype=self.dtype)
+        for name in names:
+            block[name]=data[name]
+        return block
+
+    def _block_bytes(self,block):
+        # the rows are converted field by field to the fits binary table layout:
+        # big-endian numbers, unsigned integers shifted by TZERO, logicals as 'T'/'F', ascii strings
+        rows=np.empty(block.size,dtype=self._fits_dtype)
+        for name in self.dtype.names:
+            column=block[name]
+            kind=column.dtype.kind
+            if kind=='b':
+                rows[name]=np.where(column,ord('T'),ord('F'))
+            elif kind=='U':
+                rows[name]=np.char.encode(column,'ascii')
+            elif kind=='u' and column.dtype.itemsize>1:
+                rows[name]=(column^(1<<(8*column.dtype.itemsize-1))).view(column.dtype.str.replace('u','i'))
+            else:
+                rows[name]=column
+        return rows.tobytes()
+
@@ -0,0 +1,297 @@
+#  
+# Copyright (C) 2012-2020 Euclid Science Ground Segment      
+#    
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General    
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)    
+# any later version.    
+#    
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied    
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more    
+# details.    
+#    
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to    
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA    
+#
+
+"""
+Overview
+--------
+This module provides the implementation of basic functions for I/O with directories of
+`.npy` files, that can be memory-mapped, and a JSON schema.
+
+
+
+
+
+Module API
+----------
+"""
+
+
+from __future__ import absolute_import, division, print_function
+
+from builtins import (bytes, str, open, super, range,
+                      zip, round, input, int, pow, object, map, zip)
+
+
+__author__ = "Andrea Tramacere"
+
+# Standard library
+# eg copy
+# absolute import rg:from copy import deepcopy
+import hashlib
+import json
+import os
+
+# Dependencies
+# eg numpy
+# absolute import eg: import numpy as np
+import  numpy as np
+
+# Project
+# relative import eg: from .mod import f
+
+
+_schema_file_name='schema.json'
+
+_replace=getattr(os,'replace',os.rename)
+
+
+def write_memmap_dir(directory,arrays_dict,schema=None):
+    """
+    writes each array in `arrays_dict` to a `.npy` file in `directory`, and the schema
+    to a JSON file
+
+    Parameters
+    ----------
+    directory : string
+        the output directory, created if not existing
+    arrays_dict : dictionary
+        name->:class:`numpy.ndarray`, arrays with a `None` value are skipped. Arrays already
+        memory-mapped to their file in `directory` (see :func:`open_memmap_array`) are not rewritten
+    schema : dictionary, optional
+        JSON serializable dictionary
+
+    Returns
+    -------
+
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    # the schema is removed first, so that a partially written directory is not valid
+    schema_file=os.path.join(directory,_schema_file_name)
+    if os.path.isfile(schema_file):
+        os.remove(schema_file)
+
+    if schema is None:
+        schema={}
+
+    schema=dict(schema)
+    schema['arrays']=[]
+    for name,array in arrays_dict.items():
+        if array is not None:
+            file_name=os.path.join(directory,'%s.npy'%name)
+            if _is_memmap_of(array,file_name):
+                pass
+            else:
+                # the file is replaced, so that arrays still mapping the old file remain valid
+                tmp_file_name=os.path.join(directory,'%s.tmp.npy'%name)
+                np.save(tmp_file_name,array)
+                _replace(tmp_file_name,file_name)
+            schema['arrays'].append(name)
+
+    with open(schema_file,'w') as f:
+        json.dump(schema,f,indent=1)
+
+
+def open_memmap_array(directory,name,shape,dtype,order='C'):
+    """
+    creates a writable :class:`numpy.memmap` array, stored in the `.npy` file of `directory`
+    used by :func:`write_memmap_dir` for the array `name`, so that large arrays can be filled
+    in blocks without being allocated in memory
+
+    Parameters
+    ----------
+    directory : string
+        the output directory, created if not existing
+    name : string
+        the name of the array
+    shape : tuple of int
+    dtype : numpy dtype
+    order : str
+        'C' or 'F'
+
+    Returns
+    -------
+    array : :class:`numpy.memmap`
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    return np.lib.format.open_memmap(os.path.join(directory,'%s.npy'%name),
+                                     mode='w+',
+                                     dtype=dtype,
+                                     shape=shape,
+                                     fortran_order=order=='F')
+
+
+def _is_memmap_of(array,file_name):
+    """
+    checks if `array` is a view of the whole :class:`numpy.memmap` array mapped to `file_name`
+    """
+    if not os.path.exists(file_name):
+        return False
+
+    base=array
+    while isinstance(base,np.ndarray):
+        if isinstance(base,np.memmap) and base.filename is not None:
+            return os.path.samefile(base.filename,file_name) \
+                   and base.shape==array.shape \
+                   and base.strides==array.strides \
+                   and base.ctypes.data==array.ctypes.data
+        base=base.base
+
+    return False
+
+
+def file_checksum(file_name,full=False,block_size=1048576):
+    """
+    Returns a checksum of a file, to check if a cache built from the file is still valid.
+    By default, the checksum is computed from the file size, the modification time, and the
+    first and last `block_size` bytes, so that it costs the same for any file size.
+    If `full` is True, the whole file content is hashed
+
+    Parameters
+    ----------
+    file_name : string
+    full : bool
+        if True, the whole file is hashed
+    block_size : int
+        size in bytes of the blocks read
+
+    Returns
+    -------
+    checksum : string
+    """
+    stat=os.stat(file_name)
+    h=hashlib.sha1()
+    h.update(('%d %d'%(stat.st_size,int(stat.st_mtime))).encode('utf-8'))
+    with open(file_name,'rb') as f:
+        if full==True:
+            for block in iter(lambda: f.read(block_size),b''):
+                h.update(block)
+        else:
+            h.update(f.read(block_size))
+            if stat.st_size>block_size:
+                f.seek(max(block_size,stat.st_size-block_size))
+                h.update(f.read(block_size))
+
+    return h.hexdigest()
+
+
+def options_key(options):
+    """
+    Returns a key identifying a dictionary of options, e.g. the arguments used to build
+    a dataset from a file. Arrays are hashed by value
+
+    Parameters
+    ----------
+    options : dictionary
+
+    Returns
+    -------
+    key : string
+    """
+    if options is None:
+        options={}
+
+    dump=json.dumps(options,sort_keys=True,default=_options_json_default)
+    return hashlib.sha1(dump.encode('utf-8')).hexdigest()
+
+
+def _options_json_default(o):
+    """
+    Serializes the options values not supported by json: arrays by value, dtypes and
+    numeric types by their dtype string, anything else by its repr
+    """
+    if isinstance(o,(np.ndarray,np.generic)):
+        return o.tolist()
+    if isinstance(o,np.dtype) or (isinstance(o,type) and issubclass(o,(np.generic,bool,int,float,complex))):
+        return np.dtype(o).str
+    return repr(o)
+
+
+def source_schema(source_file,source_options=None):
+    """
+    Returns the schema entries identifying the source file of a memmap directory
+
+    Parameters
+    ----------
+    source_file : string
+        the source file
+    source_options : dictionary, optional
+        the options used to read the source file
+
+    Returns
+    -------
+    schema : dictionary
+    """
+    return {'source_checksum':file_checksum(source_file),
+            'source_options_key':options_key(source_options)}
+
+
+def is_valid_memmap_dir(directory,source_file,source_options=None):
+    """
+    Checks if a directory written by :func:`write_memmap_dir` exists, and if it was built from
+    the current content of `source_file`, with the same `source_options`
+
+    Parameters
+    ----------
+    directory : string
+    source_file : string
+        the source file
+    source_options : dictionary, optional
+        the options used to read the source file
+
+    Returns
+    -------
+    is_valid : bool
+    """
+    schema_file=os.path.join(directory,_schema_file_name)
+    if not os.path.isfile(schema_file):
+        return False
+
+    with open(schema_file,'r') as f:
+        schema=json.load(f)
+
+    current=source_schema(source_file,source_options)
+    return schema.get('source_checksum')==current['source_checksum'] \
+           and schema.get('source_options_key')==current['source_options_key']
+
+
+def read_memmap_dir(directory,mmap_mode='r'):
+    """
+    reads the arrays and the schema written by :func:`write_memmap_dir`
+
+    Parameters
+    ----------
+    directory : string
+        the input directory
+    mmap_mode : {None, 'r+', 'r', 'w+', 'c'}, optional
+        the memory-mapping mode of :func:`numpy.load`, if None the arrays are loaded in memory
+
+    Returns
+    -------
+    arrays_dict : dictionary
+        name->:class:`numpy.ndarray` (:class:`numpy.memmap` if `mmap_mode` is not None)
+    schema : dictionary
+    """
+    with open(os.path.join(directory,_schema_file_name),'r') as f:
+        schema=json.load(f)
+
+    arrays_dict={}
+    for name in schema['arrays']:
+        arrays_dict[name]=np.load(os.path.join(directory,'%s.npy'%name),mmap_mode=mmap_mode)
+
+    return arrays_dict,schema
@@ -40,7 +40,7 @@ from sklearn.ensemble import GradientBoostingRegressor
 # Project
 # relative import eg: from .mod import f
 from ..homogeneous_table.dataset_handler import check_dataset_decorate
-from ..io.fits import write_data
+from ..io.fits import FitsTableWriter
 import joblib
 import pickle
 class WrappedModel(object):
@@ -191,7 +191,7 @@ class BaseModel(object):
 
 
     @check_dataset_decorate
-    def save_mldataset_predictions(self,filename,dataset,pred=None,clobber=True):
+    def save_mldataset_predictions(self,filename,dataset,pred=None,clobber=True,chunk_size=None):
         """
         Saves the models predictions for a dataset. Actual values are taken
         from :attr:`~PrimalCore.homogeneous_table.dataset.MLDataSet.target_array`
@@ -211,10 +211,34 @@ class BaseModel(object):
         clobber : bool (default is True), Optional
             flag to activate pyfits `clobber`
 
+        chunk_size : int (default is None), Optional
+            if not None, the predictions are evaluated on blocks of `chunk_size` rows,
+            using :meth:`~PrimalCore.homogeneous_table.dataset.MLDataSet.iter_chunks`, without
+            materializing the whole :attr:`~PrimalCore.homogeneous_table.dataset.MLDataSet.features`,
+            and each block is appended to `filename` with a :class:`~PrimalCore.io.fits.FitsTableWriter`
+
         Returns
         -------
 
         """
+        header_tuple_list = [('cat_file', dataset.catalog_file, 'catalog file')]
+
+        if pred is None and chunk_size is not None:
+            # the predictions are written while they are evaluated, one block per chunk
+            writer=None
+            try:
+                for features,target,_,original_entry_ID in dataset.iter_chunks(chunk_size):
+                    data=_build_predictions_table(self.clf.predict(features),actual=target,id=original_entry_ID)
+                    if writer is None:
+                        writer=FitsTableWriter(filename,data.dtype,extra_header_tuple_list=header_tuple_list,clobber=clobber)
+                    writer.write(data)
+            finally:
+                if writer is not None:
+                    writer.close()
+
+            if writer is not None:
+                return
+
         if pred is None:
             pred = self.clf.predict(dataset.features)
         actual=dataset.target_array
@@ -252,21 +276,28 @@ class BaseModel(object):
 
         header_tuple_list = [('cat_file', catalog_file, 'catalog file')]
 
-        dt = [('pred', pred.dtype.str)]
+        data=_build_predictions_table(pred,actual=actual,id=id)
+
+        with FitsTableWriter(filename,data.dtype,extra_header_tuple_list=header_tuple_list,clobber=clobber) as writer:
+            writer.write(data)
+
+
+
+def _build_predictions_table(pred,actual=None,id=None):
+    dt = [('pred', pred.dtype.str)]
+
+    if actual is not None:
+        dt.append(('actual', actual.dtype.str))
 
-        if actual is not None:
-            dt.append(('actual', actual.dtype.str))
+    if id is not None:
+        dt.append(('original_entry_ID', id.dtype.str))
 
-        if id is not None:
-            dt.append(('original_entry_ID', id.dtype.str))
+    data = np.zeros(pred.size, dtype=dt)
+    data['pred'] = pred
 
-        data = np.zeros(pred.size, dtype=dt)
-        data['pred'] = pred
+    if actual is not None:
+        data['actual'] = actual
+    if id is not None:
+        data['original_entry_ID'] = id
 
-        if actual is not None:
-            data['actual'] = actual
-        if id is not None:
-            data['original_entry_ID'] = id
-        #print(data,dt)
-        #   return data
-        write_data(filename, data, extra_header_tuple_list=header_tuple_list,clobber=clobber)
+    return data
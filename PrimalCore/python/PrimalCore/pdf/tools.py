@@ -23,21 +23,13 @@ __author__ = "Andrea Tramacere"
 # Dependencies
 # eg numpy 
 # absolute import eg: import numpy as np
-try:
-    import  pyfits as pf
-except:
-    try:
-        from astropy.io import fits as pf
-    except ImportError:
-        raise ImportError('')
-
 import  numpy as np
 
 # Project
 # relative import eg: from .mod import f
 
 from .stats import eval_pdf_gmm
-from ..io.fits import write_data
+from ..io.fits import FitsTableWriter
 
 
 def extract_pdf(model,
@@ -49,7 +41,9 @@ def extract_pdf(model,
                 pdf_grid_max=None,
                 gmm_components=2,
                 out_file_name=None,
-                skip_gmm=False):
+                skip_gmm=False,
+                chunk_size=None,
+                return_pdf=True):
 
     """
     Fit a Gaussian Mixture Model (GMM) to the redshift distribution and return an array where each element represents the PDF of a sample.
@@ -84,24 +78,80 @@ def extract_pdf(model,
         the number of components in teh GMM model to test
     out_file_name : basestring
         output file name
+    chunk_size : int (Optional)
+        if not None, the predictions are evaluated on blocks of `chunk_size` rows,
+        using :meth:`~PrimalCore.homogeneous_table.dataset.MLDataSet.iter_chunks`, without
+        materializing the whole features array. If `out_file_name` is set, the PDFs of
+        each block are appended to the file as soon as they are evaluated
+    return_pdf : bool (Optional) default=True
+        if False, the PDFs are only written to `out_file_name` and None is returned,
+        so that with `chunk_size` the whole PDFs table is never held in memory
 
     Returns
     -------
     pdf : ndarray
-        Array with the PDF for each sample
+        Array with the PDF for each sample, None if `return_pdf` is False
 
     """
 
     if  hasattr(model.clf,'estimators_')==False:
         return None
 
-    if z_phot is None:
-        z_phot = model.clf.predict(ml_dataset.features)
+    writer=None
+    if out_file_name is not None:
+        header_tuple_list = [('cat_file', ml_dataset.catalog_file, 'catalog file')]
 
-    if randomized_datasets is None:
+    if randomized_datasets is None and chunk_size is not None:
+        # the pdf table is evaluated, and written to out_file_name, one block of rows at time
+        trials=len(model.clf.estimators_)
+        dtype=_pdf_dtype(trials,pdf_grid_size,gmm_components)
+        if out_file_name is not None:
+            writer=FitsTableWriter(out_file_name,dtype,extra_header_tuple_list=header_tuple_list)
+
+        pdf_blocks=[]
+        start=0
+        try:
+            for features,target,_,original_entry_ID in ml_dataset.iter_chunks(chunk_size):
+                stop=start+features.shape[0]
+                if z_phot is None:
+                    z_phot_block=model.clf.predict(features)
+                else:
+                    z_phot_block=z_phot[start:stop]
+
+                pdf=_eval_pdf_table(dtype,
+                                    original_entry_ID,
+                                    target,
+                                    z_phot_block,
+                                    model.eval_estimators_predictions(features),
+                                    pdf_grid_size,
+                                    pdf_grid_min,
+                                    pdf_grid_max,
+                                    gmm_components,
+                                    skip_gmm)
+                if writer is not None:
+                    writer.write(pdf)
+                if return_pdf is True:
+                    pdf_blocks.append(pdf)
+                start=stop
+        finally:
+            if writer is not None:
+                writer.close()
+
+        if return_pdf is True:
+            if len(pdf_blocks)==0:
+                return np.zeros(0,dtype=dtype)
+            return np.concatenate(pdf_blocks)
+        else:
+            return None
+
+    elif randomized_datasets is None:
+        if z_phot is None:
+            z_phot = model.clf.predict(ml_dataset.features)
         trials=len(model.clf.estimators_)
         pred_z_phot = model.eval_estimators_predictions(ml_dataset.features)
     else:
+        if z_phot is None:
+            z_phot = model.clf.predict(ml_dataset.features)
         trials=randomized_datasets.shape[0]
 
         pred_z_phot=np.zeros((ml_dataset.features_N_rows,trials))
@@ -111,32 +161,63 @@ def extract_pdf(model,
 
         print('prediction on random done')
 
-    c1 = pf.Column(name='original_row_ID', format='J', array=ml_dataset.features_original_entry_ID)
+    dtype=_pdf_dtype(trials,pdf_grid_size,gmm_components)
 
-    if  ml_dataset._target_array is not None:
-        z_spec=ml_dataset.target_array
+    pdf=_eval_pdf_table(dtype,
+                        ml_dataset.features_original_entry_ID,
+                        ml_dataset.target_array,
+                        z_phot,
+                        pred_z_phot,
+                        pdf_grid_size,
+                        pdf_grid_min,
+                        pdf_grid_max,
+                        gmm_components,
+                        skip_gmm)
+
+    if out_file_name is not None:
+        with FitsTableWriter(out_file_name,dtype,extra_header_tuple_list=header_tuple_list) as writer:
+            writer.write(pdf)
+
+    if return_pdf is True:
+        return pdf
     else:
-        z_spec=np.ones(ml_dataset.features_N_rows)*-1
+        return None
 
-    c2 = pf.Column(name='z_spec', format='D', array=z_spec)
-    c3 = pf.Column(name='z_phot', format='D', array=z_phot)
-    c4 = pf.Column(name='z_phot_values', format='%dD'%(trials), )
-    c5 = pf.Column(name='z_phot_pdf_grid', format='%dD' % (pdf_grid_size), )
-    c6 = pf.Column(name='z_phot_pdf', format='%dD' % (pdf_grid_size), )
-    c7 = pf.Column(name='z_gmm_mu', format='%dD' % (gmm_components), )
-    c8 = pf.Column(name='z_gmm_sig', format='%dD' % (gmm_components), )
-    c9 = pf.Column(name='z_gmm_w', format='%dD' % (gmm_components), )
-    coldefs = pf.ColDefs([c1,c2,c3,c4,c5,c6,c7,c8,c9])
-    tbhdu = pf.BinTableHDU.from_columns(coldefs)
 
 
+def _pdf_dtype(trials,pdf_grid_size,gmm_components):
+    return np.dtype([('original_row_ID', '>i4'),
+                     ('z_spec', '>f8'),
+                     ('z_phot', '>f8'),
+                     ('z_phot_values', '>f8', (trials,)),
+                     ('z_phot_pdf_grid', '>f8', (pdf_grid_size,)),
+                     ('z_phot_pdf', '>f8', (pdf_grid_size,)),
+                     ('z_gmm_mu', '>f8', (gmm_components,)),
+                     ('z_gmm_sig', '>f8', (gmm_components,)),
+                     ('z_gmm_w', '>f8', (gmm_components,))])
 
 
-    #
-    for trial in range(trials):
 
+def _eval_pdf_table(dtype,
+                    original_row_ID,
+                    z_spec,
+                    z_phot,
+                    pred_z_phot,
+                    pdf_grid_size,
+                    pdf_grid_min,
+                    pdf_grid_max,
+                    gmm_components,
+                    skip_gmm):
 
-        tbhdu.data['z_phot_values'][:,trial]=pred_z_phot[:,trial]
+    pdf=np.zeros(pred_z_phot.shape[0],dtype=dtype)
+
+    pdf['original_row_ID']=original_row_ID
+    if  z_spec is not None:
+        pdf['z_spec']=z_spec
+    else:
+        pdf['z_spec']=-1
+    pdf['z_phot']=z_phot
+    pdf['z_phot_values']=pred_z_phot
 
     if skip_gmm is False:
         for entry in range(pred_z_phot.shape[0]):
@@ -146,16 +227,10 @@ def extract_pdf(model,
                                            grid_min=pdf_grid_min,
                                            n_components=gmm_components)
             n_components = len(mu)
-            tbhdu.data['z_phot_pdf_grid'][entry] = z_grid
-            tbhdu.data['z_phot_pdf'][entry] = gmm_pdf
-            tbhdu.data['z_gmm_mu'][entry][:n_components] = mu
-            tbhdu.data['z_gmm_sig'][entry][:n_components] = sig
-            tbhdu.data['z_gmm_w'][entry][:n_components] = w
-
-    if out_file_name is not None:
-        header_tuple_list = [('cat_file', ml_dataset.catalog_file, 'catalog file')]
-
-        write_data(out_file_name,tbhdu.data,extra_header_tuple_list=header_tuple_list)
-
+            pdf['z_phot_pdf_grid'][entry] = z_grid
+            pdf['z_phot_pdf'][entry] = gmm_pdf
+            pdf['z_gmm_mu'][entry][:n_components] = mu
+            pdf['z_gmm_sig'][entry][:n_components] = sig
+            pdf['z_gmm_w'][entry][:n_components] = w
 
-    return np.array(tbhdu.data)
+    return pdf
@@ -26,6 +26,11 @@ Summary
 .. autosummary::
    handle_missing_values
    std_features
+   apply_transform
+   save_transform
+   load_transform
+   FeaturesImputer
+   ColumnsBlocksTransform
    dataset_train_test_split
    drop_bad_values
    drop_nan_inf
@@ -48,16 +53,15 @@ __author__ = "Andrea Tramacere"
 # Standard library
 # eg copy
 # absolute import rg:from copy import deepcopy
+from contextlib import contextmanager
+from copy import deepcopy
+from multiprocessing.pool import ThreadPool
 
 # Dependencies
 # eg numpy 
 # absolute import eg: import numpy as np
 import  numpy as np
-try:
-    from sklearn.preprocessing import Imputer
-except:
-    from sklearn.impute import SimpleImputer as Imputer
-
+import joblib
 from sklearn.preprocessing import StandardScaler
 from  sklearn.model_selection import StratifiedShuffleSplit,ShuffleSplit
 
@@ -71,42 +75,466 @@ from ..homogeneous_table.dataset_handler import *
 
 
 #------------------------------------
-# sklearn based
+# fitted transforms
 #------------------------------------
+class FeaturesImputer(object):
+    """
+    Replaces missing values with the statistics of each column, with the same `fit`/`transform`
+    interface of :class:`sklearn.impute.SimpleImputer`. At variance with the sklearn imputer, the
+    `mean` and `constant` strategies can be fitted in streaming over blocks of rows
+    with :meth:`partial_fit`, and the columns with all the entries missing are not removed,
+    so that the transform preserves the shape of the features
+
+    Parameters
+    ----------
+    missing_values : number, or 'NaN' (default='NaN')
+        the placeholder of the missing values
+    strategy : {'mean','median','most_frequent','constant'} (default='mean')
+        the statistics replacing the missing values, 'median' and 'most_frequent'
+        can be fitted only on the whole features array
+    fill_value : number, optional
+        the value used with the 'constant' strategy, if None 0 is used, as for the sklearn imputer
+
+    Attributes
+    ----------
+    statistics_ : 1dim array
+        the value replacing the missing values of each column, NaN if a column has all
+        the entries missing
+    """
+
+    _streaming_strategies=['mean','constant']
+
+    def __init__(self,missing_values='NaN',strategy='mean',fill_value=None):
+        if strategy not in ['mean','median','most_frequent','constant']:
+            raise RuntimeError('strategy %s not supported'%strategy)
+
+        self.missing_values=missing_values
+        self.strategy=strategy
+        self.fill_value=fill_value
+        self._reset()
+
+    def _reset(self):
+        self._sum=None
+        self._count=None
+        self.statistics_=None
+
+    def _missing_mask(self,X):
+        if self.missing_values=='NaN' or (np.isscalar(self.missing_values) and self.missing_values!=self.missing_values):
+            return np.isnan(X)
+        else:
+            return X==self.missing_values
+
+    @property
+    def streaming(self):
+        """
+        True if the strategy can be fitted with :meth:`partial_fit`
+        """
+        return self.strategy in self._streaming_strategies
+
+    def partial_fit(self,X):
+        """
+        Updates the statistics with a block of rows
+
+        Parameters
+        ----------
+        X : 2dim array
+
+        Returns
+        -------
+        self
+        """
+        if self.streaming is False:
+            raise RuntimeError('strategy %s can not be fitted in streaming, use fit'%self.strategy)
+
+        if self.strategy=='constant':
+            fill_value=0 if self.fill_value is None else self.fill_value
+            self.statistics_=np.full(X.shape[1],fill_value,dtype=np.float64)
+            return self
+
+        missing=self._missing_mask(X)
+        block_sum=np.where(missing,0,X).sum(axis=0,dtype=np.float64)
+        block_count=X.shape[0]-np.count_nonzero(missing,axis=0)
+        if self._sum is None:
+            self._sum=block_sum
+            self._count=block_count
+        else:
+            self._sum+=block_sum
+            self._count+=block_count
+
+        with np.errstate(invalid='ignore',divide='ignore'):
+            self.statistics_=np.where(self._count>0,self._sum/self._count,np.nan)
+        return self
+
+    def fit(self,X):
+        """
+        Evaluates the statistics from the whole features array
+
+        Parameters
+        ----------
+        X : 2dim array
+
+        Returns
+        -------
+        self
+        """
+        self._reset()
+        if self.streaming is True:
+            return self.partial_fit(X)
+
+        missing=self._missing_mask(X)
+        self.statistics_=np.full(X.shape[1],np.nan)
+        for ID in range(X.shape[1]):
+            values=X[~missing[:,ID],ID]
+            if values.size==0:
+                continue
+            if self.strategy=='median':
+                self.statistics_[ID]=np.median(values)
+            else:
+                values,counts=np.unique(values,return_counts=True)
+                self.statistics_[ID]=values[np.argmax(counts)]
+        return self
+
+    def transform(self,X):
+        """
+        Replaces the missing values
+
+        Parameters
+        ----------
+        X : 2dim array
+
+        Returns
+        -------
+        X : 2dim array
+            a copy of `X` with the missing values replaced
+        """
+        if self.statistics_ is None:
+            raise RuntimeError('the imputer is not fitted')
+
+        missing=self._missing_mask(X)
+        return np.where(missing,self.statistics_,X)
+
+    def fit_transform(self,X):
+        return self.fit(X).transform(X)
+
+
+def _columns_blocks(N_cols,n_threads):
+    """
+    Splits `N_cols` columns in at most `n_threads` contiguous blocks, as slices
+    """
+    bounds=np.linspace(0,N_cols,min(n_threads,max(N_cols,1))+1).astype(np.int64)
+    return [slice(int(start),int(stop)) for start,stop in zip(bounds[:-1],bounds[1:]) if stop>start]
+
+
+def _map_columns_blocks(func,blocks,pool=None):
+    """
+    Maps `func` over the columns `blocks`, in `pool`, or serially if `pool` is None.
+    The work of `func` is expected to be done by numpy kernels releasing the GIL
+    """
+    if pool is None or len(blocks)<=1:
+        return [func(ID,block) for ID,block in enumerate(blocks)]
+
+    return pool.map(lambda args: func(*args),list(enumerate(blocks)))
+
+
+@contextmanager
+def _threads_pool(n_threads,transform=None):
+    """
+    Context providing the pool of threads used by a whole preprocessing call, None if
+    `n_threads`<=1. If `transform` is a :class:`ColumnsBlocksTransform`, the pool is
+    attached to it for the duration of the call, or its pool is reused if already attached
+    """
+    blocks_transform=isinstance(transform,ColumnsBlocksTransform)
+    if blocks_transform is True:
+        if transform._pool is not None:
+            yield transform._pool
+            return
+        n_threads=max(n_threads,transform.n_threads)
+
+    pool=None
+    if n_threads>1:
+        pool=ThreadPool(n_threads)
+    if blocks_transform is True:
+        transform._pool=pool
+
+    try:
+        yield pool
+    finally:
+        if blocks_transform is True:
+            transform._pool=None
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+
+class ColumnsBlocksTransform(object):
+    """
+    Spreads the column-wise work of a transform (e.g. :class:`sklearn.preprocessing.StandardScaler`,
+    or :class:`FeaturesImputer`) over a pool of threads: the columns are split in `n_threads` blocks,
+    and an independent copy of `transform` is fitted and applied to each block. This is equivalent
+    to `transform` when its statistics are evaluated independently for each column.
+    The pool is created once for each call of the preprocessing functions (and of
+    :func:`apply_transform`), if the transform is used directly the blocks are processed serially
+
+    Parameters
+    ----------
+    transform : un-fitted transform
+        the transform applied to each block of columns
+    n_threads : int
+        the number of threads, and of blocks of columns
+
+    Attributes
+    ----------
+    blocks_ : list of slices
+        the blocks of columns
+    transforms_ : list
+        the transform fitted to each block
+    """
+
+    def __init__(self,transform,n_threads):
+        self.transform_template=transform
+        self.n_threads=n_threads
+        self.blocks_=None
+        self.transforms_=None
+        self._pool=None
+
+    def __getstate__(self):
+        state=dict(self.__dict__)
+        state['_pool']=None
+        return state
+
+    @property
+    def streaming(self):
+        """
+        True if the transform can be fitted with :meth:`partial_fit`
+        """
+        return hasattr(self.transform_template,'partial_fit') and getattr(self.transform_template,'streaming',True) is True
+
+    def _set_blocks(self,N_cols):
+        self.blocks_=_columns_blocks(N_cols,self.n_threads)
+        self.transforms_=[deepcopy(self.transform_template) for block in self.blocks_]
+
+    def partial_fit(self,X):
+        """
+        Updates the transform of each block of columns with a block of rows
+
+        Parameters
+        ----------
+        X : 2dim array
+
+        Returns
+        -------
+        self
+        """
+        if self.blocks_ is None:
+            self._set_blocks(X.shape[1])
+        _map_columns_blocks(lambda ID,block: self.transforms_[ID].partial_fit(X[:,block]),self.blocks_,self._pool)
+        return self
+
+    def fit(self,X):
+        """
+        Fits the transform of each block of columns
+
+        Parameters
+        ----------
+        X : 2dim array
+
+        Returns
+        -------
+        self
+        """
+        self._set_blocks(X.shape[1])
+        _map_columns_blocks(lambda ID,block: self.transforms_[ID].fit(X[:,block]),self.blocks_,self._pool)
+        return self
+
+    def transform(self,X):
+        """
+        Applies the transform of each block of columns
+
+        Parameters
+        ----------
+        X : 2dim array
+
+        Returns
+        -------
+        X : 2dim array
+            the transformed array
+        """
+        if self.blocks_ is None:
+            raise RuntimeError('the transform is not fitted')
+        return np.concatenate(_map_columns_blocks(lambda ID,block: self.transforms_[ID].transform(X[:,block]),
+                                                  self.blocks_,
+                                                  self._pool),axis=1)
+
+    def fit_transform(self,X):
+        return self.fit(X).transform(X)
+
+
+def _fit_features(transform,dataset,chunk_size):
+    """
+    Fits `transform` to the un-masked features of `dataset`, streaming the blocks of rows
+    with `partial_fit`, if the transform supports it
+    """
+    if hasattr(transform,'partial_fit') and getattr(transform,'streaming',True) is True:
+        for features in dataset._iter_features_blocks(chunk_size):
+            transform.partial_fit(features)
+    else:
+        transform.fit(dataset._features)
+
+    return transform
+
+
 @check_dataset_decorate
-def handle_missing_values(dataset, missing_values='NaN', strategy='mean'):
+def apply_transform(dataset, transform, chunk_size=100000):
+    """
+    Applies a fitted transform (e.g. returned by :func:`std_features` or :func:`handle_missing_values`)
+    to the features of a dataset, in place, in blocks of `chunk_size` rows, without allocating
+    a second features array
+
+    Parameters
+    ----------
+    dataset :  :class:`.dataset.MLDataSet` object
+    transform : fitted object with a `transform` method
+    chunk_size : int (default=100000)
+        the number of rows of each block
+
+    Returns
+    -------
+
     """
-    Replace missing values using the :class:`sklearn.preprocessing.Imputer class`
+    with _threads_pool(1,transform):
+        dataset._transform_features(transform.transform,chunk_size=chunk_size)
+
+
+def _apply_to_test(test,transform,chunk_size):
+    if test is None:
+        return
+    if type(test)!=list:
+        test=[test]
+    for dataset in test:
+        apply_transform(dataset,transform,chunk_size=chunk_size)
+
+
+def save_transform(transform,file_name):
+    """
+    Saves a fitted transform, to apply it later to other datasets with :func:`apply_transform`
 
     Parameters
     ----------
-    missing_values
-    strategy
-    axis
+    transform : fitted transform
+    file_name : string
 
     Returns
     -------
 
     """
+    joblib.dump(transform, file_name)
+
+
+def load_transform(file_name):
+    """
+    Loads a transform saved by :func:`save_transform`
 
-    imp = Imputer(missing_values=missing_values, strategy=strategy)
-    dataset._features = imp.fit_transform(dataset._features)
+    Parameters
+    ----------
+    file_name : string
 
+    Returns
+    -------
+    transform : fitted transform
+    """
+    return joblib.load(file_name)
+
+
+#------------------------------------
+# sklearn based
+#------------------------------------
 @check_dataset_decorate
-def std_features(dataset, test=None):
+def handle_missing_values(dataset, missing_values='NaN', strategy='mean', test=None, imputer=None, fill_value=None, chunk_size=100000, n_threads=1):
     """
-    standardize features using the :class:`sklearn.preprocessing.data.StandardScaler`
+    Replace missing values, in place, using a :class:`FeaturesImputer`.
+    The imputer is fitted on `dataset`, in streaming over blocks of `chunk_size` rows for
+    the 'mean' and 'constant' strategies, and is returned, so that it can be applied to
+    other datasets (see :func:`apply_transform`)
+
     Parameters
     ----------
-    dataset
-    test
+    dataset :  :class:`.dataset.MLDataSet` object
+    missing_values : number, or 'NaN' (default='NaN')
+    strategy : {'mean','median','most_frequent','constant'} (default='mean')
+    test : :class:`.dataset.MLDataSet` object, or list of, optional
+        datasets transformed with the imputer fitted on `dataset`
+    imputer : fitted imputer, optional
+        if provided, it is applied without fitting
+    fill_value : number, optional
+        the value used with the 'constant' strategy, if None 0 is used
+    chunk_size : int (default=100000)
+        the number of rows of each block
+    n_threads : int (default=1)
+        if larger than 1, the imputer is fitted and applied over blocks of columns,
+        in a pool of threads (see :class:`ColumnsBlocksTransform`)
 
     Returns
     -------
+    imputer : :class:`FeaturesImputer`, or :class:`ColumnsBlocksTransform` if `n_threads`>1
+        the fitted imputer
+    """
+
+    if imputer is None:
+        imputer = FeaturesImputer(missing_values=missing_values, strategy=strategy, fill_value=fill_value)
+        if n_threads>1:
+            imputer = ColumnsBlocksTransform(imputer,n_threads)
+        fit=True
+    else:
+        fit=False
+
+    with _threads_pool(n_threads,imputer):
+        if fit is True:
+            _fit_features(imputer,dataset,chunk_size)
+        apply_transform(dataset,imputer,chunk_size=chunk_size)
+        _apply_to_test(test,imputer,chunk_size)
+
+    return imputer
 
+@check_dataset_decorate
+def std_features(dataset, test=None, scaler=None, chunk_size=100000, n_threads=1):
     """
-    stdsc = StandardScaler()
-    dataset._features = stdsc.fit_transform(dataset._features)
+    standardize features, in place, using the :class:`sklearn.preprocessing.StandardScaler`.
+    The scaler is fitted on `dataset` with `partial_fit`, in streaming over blocks of `chunk_size`
+    rows, and is returned, so that it can be applied to other datasets (see :func:`apply_transform`)
+
+    Parameters
+    ----------
+    dataset :  :class:`.dataset.MLDataSet` object
+    test : :class:`.dataset.MLDataSet` object, or list of, optional
+        datasets standardized with the scaler fitted on `dataset`
+    scaler : fitted scaler, optional
+        if provided, it is applied without fitting
+    chunk_size : int (default=100000)
+        the number of rows of each block
+    n_threads : int (default=1)
+        if larger than 1, the scaler is fitted and applied over blocks of columns,
+        in a pool of threads (see :class:`ColumnsBlocksTransform`)
+
+    Returns
+    -------
+    scaler : :class:`sklearn.preprocessing.StandardScaler`, or :class:`ColumnsBlocksTransform` if `n_threads`>1
+        the fitted scaler
+    """
+    if scaler is None:
+        scaler = StandardScaler()
+        if n_threads>1:
+            scaler = ColumnsBlocksTransform(scaler,n_threads)
+        fit=True
+    else:
+        fit=False
+
+    with _threads_pool(n_threads,scaler):
+        if fit is True:
+            _fit_features(scaler,dataset,chunk_size)
+        apply_transform(dataset,scaler,chunk_size=chunk_size)
+        _apply_to_test(test,scaler,chunk_size)
+
+    return scaler
 
 
 @check_dataset_decorate
@@ -159,65 +587,53 @@ def dataset_train_test_split(dataset,train_ratio=None,stratify=True,random_state
 # cleaning
 #------------------------------------
 @check_dataset_decorate
-def drop_bad_values(dataset, bad_value):
+def drop_bad_values(dataset, bad_value, chunk_size=100000, n_threads=1):
     """
     Removes bad values.
 
     Removes a whole column if all the entries have a bad_value
     Removes a row if any of the entry in the row has a bad_value
 
+    The columns and rows tests are evaluated in a single vectorized pass over all the rows
+    and columns of the features, regardless of the rows and columns masks, in blocks of
+    `chunk_size` rows
 
     Parameters
     ----------
     dataset :  :class:`.dataset.MLDataSet` object
     bad_value :
+    chunk_size : int (default=100000)
+        the number of rows of each block
+    n_threads : int (default=1)
+        if larger than 1, each block is processed over blocks of columns, in a pool of threads
 
     Returns
     -------
 
     """
 
-
-
     print("| features cleaning for bad_value=", bad_value)
     print("| features initial Rows,Cols=", dataset.features_N_rows, dataset.features_N_cols)
-    # removes a whole column is all the elements in the are
-    # all== inf or
-    # all== nan or
-    # all== inf or nan
-    black_list = []
-    use_IDs_list = np.arange(dataset.features.shape[1])
-    for ID, name in enumerate(dataset._features_names):
-
-        bad_column = ~np.all(dataset.features[:, ID] == bad_value)
-
-        if bad_column is True:
-            use_IDs_list.remove(ID)
-            black_list.append(name)
-
-    print("| removed columns", black_list)
-
-    drop_features(dataset,black_list)
-
-    # removes a row if any of the entry in the row is == bad_value
-    masked = np.zeros(dataset.features_N_rows, dtype=np.bool)
-    for ID in range(dataset.features_N_rows):
-        masked[ID] = np.any(dataset.features[ID] == bad_value)
-    print(dataset.features[masked])
-    keep_rows(dataset, ~masked)
-    print("|removed rows", np.sum(masked),masked.shape)
-    print("| features cleaned Rows,Cols=", dataset.features_N_rows, dataset.features_N_cols)
-    print("")
+
+    _drop_bad_columns_rows(dataset,lambda features: features == bad_value,chunk_size,n_threads)
 
 @check_dataset_decorate
-def drop_nan_inf(dataset):
+def drop_nan_inf(dataset, chunk_size=100000, n_threads=1):
     """
     Removes a whole column if all the entries in the columns are NaN or Inf
     Removes a row if  any of the entry in the row are NaN or Inf
 
+    The columns and rows tests are evaluated in a single vectorized pass over all the rows
+    and columns of the features, regardless of the rows and columns masks, in blocks of
+    `chunk_size` rows
+
     Parameters
     ----------
     dataset :  :class:`.dataset.MLDataSet` object
+    chunk_size : int (default=100000)
+        the number of rows of each block
+    n_threads : int (default=1)
+        if larger than 1, each block is processed over blocks of columns, in a pool of threads
 
     Returns
     -------
@@ -227,30 +643,60 @@ def drop_nan_inf(dataset):
     print("| features cleaning for nan/inf")
     print("| features initial Rows,Cols=", dataset.features_N_rows, dataset.features_N_cols)
 
-    # removes a whole column is all the elements in the are
-    # all== inf or
-    # all== nan or
-    # all== inf or nan
-    black_list = []
-    for ID, name in enumerate(dataset._features_names):
+    _drop_bad_columns_rows(dataset,lambda features: ~np.isfinite(features),chunk_size,n_threads)
 
-        # we skip strings
 
-        bad_column = ~np.all(np.logical_or(np.isnan(dataset.features[:, ID]), np.isinf(dataset.features[:, ID])))
+def _drop_bad_columns_rows(dataset,is_bad,chunk_size,n_threads=1):
+    bad_columns,bad_rows=_bad_columns_rows(dataset,is_bad,chunk_size,n_threads)
 
-        if bad_column is True:
-
-            black_list.append(name)
-    drop_features(dataset,black_list)
+    black_list=[name for name,bad in zip(dataset._features_names,bad_columns) if bad]
+    drop_features(dataset,black_list,regex=False)
     print("|removed columns", black_list)
 
-    # removes a row if any of the entry in the row is inf or nan
-    masked = np.zeros(dataset.features_N_rows, dtype=np.bool)
-    for ID in range(dataset.features.shape[0]):
-        masked[ID] = np.any(np.isinf(dataset.features[ID])) or np.any(np.isnan(dataset.features[ID]))
-    keep_rows(dataset,~masked)
-    print("|removed rows", np.sum(masked))
+    keep_rows(dataset,~bad_rows)
+    print("|removed rows", np.sum(bad_rows))
     print("| features cleaned Rows,Cols=", dataset.features_N_rows, dataset.features_N_cols)
     print("")
 
 
+def _bad_columns_rows(dataset,is_bad,chunk_size,n_threads=1):
+    """
+    Evaluates, in one pass over the blocks of rows of the un-masked features
+    (see :meth:`.dataset.MLDataSet._iter_features_blocks`), the columns with all the
+    entries bad, and the rows with at least one bad entry in the other columns. The rows
+    and columns masks are not applied, so that the returned arrays match the features names
+    and the rows selected by :func:`keep_rows`. `is_bad` maps a features block to its boolean matrix of bad entries,
+    so that only a `chunk_size` x N_cols temporary matrix is allocated. If `n_threads`>1,
+    the reductions of each block are split over blocks of columns, in a pool of threads.
+
+    Since the bad columns are bad in every row, a row has a bad entry in the
+    remaining columns if its number of bad entries is larger than the number of bad columns
+
+    Returns
+    -------
+    bad_columns : 1dim bool array
+    bad_rows : 1dim bool array
+    """
+    bad_columns=np.ones(dataset.features_N_cols,dtype=np.bool_)
+    bad_counts=np.zeros(dataset.features_N_rows,dtype=np.int64)
+    blocks=_columns_blocks(dataset.features_N_cols,n_threads)
+
+    def reduce_block(features,ID,block):
+        bad=is_bad(features[:,block])
+        bad_columns[block]&=bad.all(axis=0)
+        return np.count_nonzero(bad,axis=1)
+
+    start=0
+    with _threads_pool(min(n_threads,len(blocks))) as pool:
+        for features in dataset._iter_features_blocks(chunk_size):
+            stop=start+features.shape[0]
+            for counts in _map_columns_blocks(lambda ID,block: reduce_block(features,ID,block),blocks,pool):
+                bad_counts[start:stop]+=counts
+            start=stop
+
+    if dataset.features_N_rows==0:
+        bad_columns[:]=False
+
+    bad_rows=bad_counts>np.count_nonzero(bad_columns)
+
+    return bad_columns,bad_rows
@@ -1,7 +1,14 @@
 import unittest
+import shutil
+import tempfile
 
 from ElementsKernel.Path import getPathFromEnvVariable
 from PrimalCore.heterogeneous_table.table import Table
+from PrimalCore.homogeneous_table.dataset import MLDataSet
+from PrimalCore.homogeneous_table.dataset_handler import new_from_fits_chunks,new_from_rows,add_features,drop_features
+from PrimalCore.preprocessing.dataset_preprocessing import drop_nan_inf
+from PrimalCore.io.fits import FitsTableWriter
+from astropy.io import fits as pf
 import  numpy as np
 class TableTestCase(unittest.TestCase):
 
@@ -38,5 +45,148 @@ class TableTestCase(unittest.TestCase):
         for name in names:
             self.assertIn(name ,self.catalog.column_names)
 
+    def test_drop_rows(self):
+        N_rows=self.catalog.N_rows
+        self.catalog.drop_rows(np.arange(N_rows)%2==0)
+        self.assertEqual(self.catalog.N_rows,N_rows//2)
+        self.assertEqual(self.catalog.original_entry_ID[0],1)
+
+    def test_add_rows(self):
+        N_rows=self.catalog.N_rows
+        for ID in range(3):
+            self.catalog.add_rows(self.catalog.data[:2])
+        self.assertEqual(self.catalog.N_rows,N_rows+6)
+        self.assertEqual(self.catalog.original_entry_ID[-1],1)
+
+    def test_data_writable(self):
+        self.catalog.data['FLUX_G_1'][:3]=-1
+        self.assertEqual(list(self.catalog.get_column('FLUX_G_1')[:3]),[-1,-1,-1])
+        self.catalog.drop_rows([0])
+        self.assertEqual(self.catalog.data['FLUX_G_1'][0],-1)
+
+    def test_keep_columns_after_data(self):
+        self.catalog.data
+        self.catalog.keep_columns(['FLUX_G_1'],regex=False)
+        column=self.catalog.get_column('FLUX_G_1')
+        self.assertTrue(column.flags.c_contiguous)
+        self.assertEqual(column.strides,(column.itemsize,))
+
+class MLDataSetTestCase(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+        features=np.arange(40,dtype=np.float64).reshape(10,4)
+        features[:,1]=np.nan
+        features[3,2]=np.inf
+        features[7,0]=np.nan
+        self.dataset=MLDataSet(features,features_names=['a','b','c','d'],features_original_entry_ID=np.arange(10))
+
+    def test_drop_nan_inf_rows_mask(self):
+        rows_mask=np.ones(10,dtype=np.bool_)
+        rows_mask[:5]=False
+        self.dataset.rows_mask=rows_mask
+        drop_nan_inf(self.dataset,chunk_size=3)
+        self.assertEqual(self.dataset.features_names,['a','c','d'])
+        self.assertEqual(self.dataset.features_N_rows,8)
+        self.assertEqual(list(self.dataset.features_original_entry_ID),[5,6,8,9])
+
+    def test_drop_nan_inf_columns_mask(self):
+        self.dataset.columns_mask=np.array([True,True,False,True])
+        drop_nan_inf(self.dataset,chunk_size=3)
+        self.assertEqual(self.dataset.features_names,['a','d'])
+        self.assertEqual(list(self.dataset.features_original_entry_ID),[0,1,2,4,5,6,8,9])
+        self.assertEqual(list(self.dataset.columns_mask),[True,False,True])
+
+    def test_new_from_rows_selection(self):
+        new=new_from_rows(self.dataset,[-2,-1])
+        self.assertEqual(new.features.shape,(2,4))
+        self.assertEqual(list(new.features_original_entry_ID),[8,9])
+        self.assertEqual(list(new.features[:,3]),[35,39])
+
+        new=new_from_rows(self.dataset,[7,2,-1])
+        self.assertEqual(list(new.features_original_entry_ID),[7,2,9])
+        self.assertEqual(list(new.features[:,3]),[31,11,39])
+
+        self.dataset.rows_mask=np.array([-1,0])
+        self.assertEqual(list(self.dataset.features_original_entry_ID),[0,9])
+
+    def test_new_from_rows_isolation(self):
+        new=new_from_rows(self.dataset,[1,2,3])
+        add_features(new,['e'],np.zeros(3))
+        self.assertEqual(self.dataset.features_names,['a','b','c','d'])
+        self.assertEqual(self.dataset.features.shape,(10,4))
+
+        new=new_from_rows(self.dataset,[1,2,3])
+        drop_features(self.dataset,['d'])
+        self.assertEqual(new.features_names,['a','b','c','d'])
+        self.assertEqual(list(new.features[:,3]),[7,11,15])
+
+    def test_fits_cache_dtype(self):
+        ph_catalog = getPathFromEnvVariable('PrimalCore/test_table.fits', 'ELEMENTS_AUX_PATH')
+        cache_directory=tempfile.mkdtemp()
+        try:
+            for ID in range(2):
+                dataset=MLDataSet.new_from_fits_file(ph_catalog,fits_ext=1,cache_directory=cache_directory,
+                                                     dtype=np.float32,skip_col_names_list=['Instr_S15'])
+                self.assertEqual(dataset.features.dtype,np.float32)
+        finally:
+            shutil.rmtree(cache_directory)
+
+    def test_fits_original_entry_ID_col_name(self):
+        ph_catalog = getPathFromEnvVariable('PrimalCore/test_table.fits', 'ELEMENTS_AUX_PATH')
+        IDs=Table.from_fits_file(ph_catalog,fits_ext=1).get_column('ID')
+        for dataset in [MLDataSet.new_from_fits_file(ph_catalog,fits_ext=1,use_col_names_list=['FLUX_G*'],
+                                                     original_entry_ID_col_name='ID'),
+                        new_from_fits_chunks(ph_catalog,chunk_rows=300,fits_ext=1,use_col_names_list=['FLUX_G*'],
+                                             original_entry_ID_col_name='ID')]:
+            self.assertEqual(dataset.features_names,['FLUX_G_1','FLUX_G_2','FLUX_G_3'])
+            self.assertTrue(np.array_equal(dataset.features_original_entry_ID,IDs))
+
+    def test_fits_chunks_target(self):
+        ph_catalog = getPathFromEnvVariable('PrimalCore/test_table.fits', 'ELEMENTS_AUX_PATH')
+        argw=dict(fits_ext=1,use_col_names_list=['FLUX_G*'],target_array=np.arange(1000.),weight_array=np.arange(1000.)*2)
+        dataset=MLDataSet.new_from_fits_file(ph_catalog,**argw)
+        chunks_dataset=new_from_fits_chunks(ph_catalog,chunk_rows=300,**argw)
+        self.assertTrue(np.array_equal(chunks_dataset.features,dataset.features))
+        self.assertTrue(np.array_equal(chunks_dataset.target_array,dataset.target_array))
+        self.assertTrue(np.array_equal(chunks_dataset.weight_array,dataset.weight_array))
+        self.assertEqual(list(chunks_dataset.target_array[300:305]),[300,301,302,303,304])
+
+class FitsTableWriterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+        self.directory=tempfile.mkdtemp()
+        self.dtype=np.dtype([('f','<f8'),('i','<i4'),('b','?'),('s','U5'),('u','<u2'),('v','<f4',(3,))])
+        self.data=np.zeros(1000,dtype=self.dtype)
+        self.data['f']=np.linspace(-1,1,1000)
+        self.data['i']=np.arange(1000)-500
+        self.data['b']=np.arange(1000)%3==0
+        self.data['s']=['row%d'%(ID%100) for ID in range(1000)]
+        self.data['u']=np.arange(1000)*60
+        self.data['v']=np.arange(3000).reshape(1000,3)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        unittest.TestCase.tearDown(self)
+
+    def test_round_trip(self):
+        file_name=self.directory+'/table.fits'
+        with FitsTableWriter(file_name,self.dtype,extra_header_tuple_list=[('EXTRA',1)]) as writer:
+            writer.write(self.data[:300])
+            writer.write(self.data[300:300])
+            writer.write(dict((name,self.data[name][300:]) for name in self.dtype.names))
+
+        hdu_list=pf.open(file_name)
+        try:
+            hdu_list.verify('exception')
+            hdu=hdu_list[1]
+            self.assertEqual(hdu.header['NAXIS2'],1000)
+            self.assertEqual(hdu.header['EXTRA'],1)
+            for name in self.dtype.names:
+                self.assertTrue(np.array_equal(np.asarray(hdu.data[name]),self.data[name]),name)
+        finally:
+            hdu_list.close()
+
 if __name__ == '__main__':
     unittest.main()